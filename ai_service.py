@@ -1,25 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
 
 OLLAMA_MODEL = "llama3.2"
+OLLAMA_URL = "http://localhost:11434"
+# Ollama sampling options sent with every generation (and part of the cache key)
+GENERATION_OPTIONS = {}
+# How long Ollama keeps the model (and its prompt cache) loaded between requests
+OLLAMA_KEEP_ALIVE = os.getenv("HIRESCOPE_OLLAMA_KEEP_ALIVE", "30m")
+
+# Responses are cached on disk keyed by transcript, model, prompt template and options.
+# Set HIRESCOPE_LLM_CACHE to an empty string to disable the cache entirely.
+LLM_CACHE_PATH = os.getenv("HIRESCOPE_LLM_CACHE", os.path.join(os.path.expanduser("~"), ".hirescope", "llm_cache.sqlite3"))
+LLM_CACHE_MAX_ENTRIES = 2000
+# prompt_eval_count values kept per prompt, so long-running services don't grow without bound
+PROMPT_EVAL_HISTORY = 256
+NO_RESPONSE = "No response from Ollama"
+
+class OllamaClient:
+    def __init__(self, base_url=OLLAMA_URL, connect_timeout=3.05, read_timeout=120,
+                 retries=2, backoff=0.5, max_in_flight=2):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        # One keep-alive session shared by every caller; the pool is sized to the in-flight cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, path, timeout=None, **kwargs):
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                if response.status_code < 500 or attempt == self.retries:
+                    return response
+                response.close()
+            except requests.ConnectionError:
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def _payload(self, fields, stream):
+        return {
+            "model": OLLAMA_MODEL,
+            **fields,
+            "options": GENERATION_OPTIONS,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "stream": stream
+        }
+
+    def _complete(self, path, fields, on_done=None):
+        with self._in_flight:
+            response = self._request("POST", path, json=self._payload(fields, False))
+            response.raise_for_status()
+            body = response.json()
+            if on_done:
+                on_done(body)
+            return _chunk_text(body) or NO_RESPONSE
+
+    def _stream(self, path, fields, on_done=None):
+        # Yields response tokens as Ollama produces them (newline-delimited JSON chunks).
+        # The in-flight slot is held until the stream is exhausted or closed.
+        with self._in_flight:
+            with self._request("POST", path, json=self._payload(fields, True), stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    token = _chunk_text(chunk)
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        if on_done:
+                            on_done(chunk)
+                        return
+
+    def generate(self, prompt):
+        return self._complete("/api/generate", {"prompt": prompt})
+
+    def stream(self, prompt):
+        return self._stream("/api/generate", {"prompt": prompt})
+
+    def chat(self, messages, on_done=None):
+        return self._complete("/api/chat", {"messages": messages}, on_done)
+
+    def stream_chat(self, messages, on_done=None):
+        return self._stream("/api/chat", {"messages": messages}, on_done)
+
+    def warm_up(self):
+        # A generate request with no prompt just loads the model; keep_alive holds it in memory
+        response = self._request("POST", "/api/generate", json=self._payload({}, False))
+        response.raise_for_status()
+
+    def is_running(self, timeout=2):
+        try:
+            r = self.session.get(self.base_url, timeout=timeout)
+            return r.status_code == 200
+        except requests.RequestException:
+            return False
+
+def _chunk_text(chunk):
+    # /api/generate puts text in "response", /api/chat in "message.content"
+    return chunk.get("response") or chunk.get("message", {}).get("content", "")
+
+client = OllamaClient()
+
+class ResponseCache:
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened on first use so importing ai_service stays cheap
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+        return self._db
+
+    @staticmethod
+    def make_key(template, fields):
+        normalized = {name: " ".join(str(value).split()) for name, value in fields.items()}
+        material = json.dumps({
+            "model": OLLAMA_MODEL,
+            "template": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+            "options": GENERATION_OPTIONS,
+            "fields": normalized,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    # A cache that can't be opened, read or written (bad path, full disk, locked or corrupt
+    # database) behaves as a miss; it must never stop a generation
+    def get(self, key):
+        with self._lock:
+            try:
+                db = self._connect()
+                row = db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                    db.commit()
+            except (sqlite3.Error, OSError):
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        with self._lock:
+            try:
+                db = self._connect()
+                db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, time.time()))
+                # Least recently used entries beyond the size bound are evicted
+                db.execute(
+                    "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+                db.commit()
+            except (sqlite3.Error, OSError):
+                pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+cache = ResponseCache() if LLM_CACHE_PATH else None
 
 def query_ollama(prompt):
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        return response.json().get("response", "No response from Ollama")
+        return client.generate(prompt)
     except Exception as e:
         return f"Error calling Ollama API: {e}"
 
-def get_interview_questions(transcript):
-    prompt = f"""
-You are an AI interview assistant. Given the candidate's answer below, generate 3 insightful follow-up interview questions the interviewer should ask next. Please note, the input might also be the interviewer's question. If that is the case, ignore or do not respond. Rate the Candidate's answer too.
+def stream_ollama(prompt):
+    try:
+        yield from client.stream(prompt)
+    except Exception as e:
+        yield f"Error calling Ollama API: {e}"
+
+class ChatPrompt:
+    # The fixed system message for one kind of /api/chat request; it holds no conversation.
+    # The system message is identical on every request, so Ollama reuses the cached KV prefix
+    # and only evaluates the new user message. prompt_eval_counts keeps what the most recent
+    # requests actually cost.
+    def __init__(self, system, history=PROMPT_EVAL_HISTORY):
+        self.system = system
+        self.prompt_eval_counts = deque(maxlen=history)
+
+    def messages(self, content):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": content},
+        ]
 
+    def record(self, chunk):
+        if "prompt_eval_count" in chunk:
+            self.prompt_eval_counts.append(chunk["prompt_eval_count"])
+
+FOLLOW_UP_SYSTEM = """You are an AI interview assistant. Given the candidate's answer, generate 3 insightful follow-up interview questions the interviewer should ask next. Please note, the input might also be the interviewer's question. If that is the case, ignore or do not respond. Rate the Candidate's answer too."""
+
+FOLLOW_UP_PROMPT = """
 Candidate's response:
 \"\"\"{transcript}\"\"\"
 
@@ -27,12 +226,10 @@ Response Rating:
 
 Interviewer questions:
 """
-    return query_ollama(prompt)
 
-def getReportForInterview(transcript):
-    prompt = f"""
-You are an AI interview assistant. Given the candidate's answer below, Generate a report summarizing the candidates responses and suitability and stuff.
+REPORT_SYSTEM = """You are an AI interview assistant. Given the candidate's answer, Generate a report summarizing the candidates responses and suitability and stuff."""
 
+REPORT_PROMPT = """
 Candidate's response:
 \"\"\"{transcript}\"\"\"
 
@@ -40,11 +237,193 @@ Candidate Rating:
 
 Interviewer Summary:
 """
-    return query_ollama(prompt)
 
-def check_ollama_running():
+DIGEST_SYSTEM = """You are an AI interview assistant. Summarize the candidate's answer in at most 3 short lines: the key points they made, any strengths or concerns, and a rating out of 10. Do not add anything else."""
+
+DIGEST_PROMPT = """
+Candidate's response:
+\"\"\"{transcript}\"\"\"
+
+Answer Summary:
+"""
+
+DIGEST_REPORT_SYSTEM = """You are an AI interview assistant. You are given short summaries of each of the candidate's answers, in the order they were given. Generate a report summarizing the candidate's responses, suitability and overall performance."""
+
+DIGEST_REPORT_PROMPT = """
+Answer summaries:
+\"\"\"{answers}\"\"\"
+
+Candidate Rating:
+
+Interviewer Summary:
+"""
+
+follow_up_chat = ChatPrompt(FOLLOW_UP_SYSTEM)
+report_chat = ChatPrompt(REPORT_SYSTEM)
+digest_chat = ChatPrompt(DIGEST_SYSTEM)
+digest_report_chat = ChatPrompt(DIGEST_REPORT_SYSTEM)
+
+def _complete(chat, template, stream=False, use_cache=True, **fields):
+    messages = chat.messages(template.format(**fields))
+    key = ResponseCache.make_key(chat.system + template, fields) if use_cache and cache else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            return _replay(cached) if stream else cached
+    if stream:
+        return _stream_and_cache(chat, messages, key)
     try:
-        r = requests.get("http://localhost:11434")
-        return r.status_code == 200
-    except:
-        return False
+        response = client.chat(messages, on_done=chat.record)
+    except Exception as e:
+        return f"Error calling Ollama API: {e}"
+    # An empty generation isn't an answer worth replaying
+    if key and response != NO_RESPONSE:
+        cache.put(key, response)
+    return response
+
+def _replay(text):
+    # A real generator, so callers can close() a cached stream like a live one
+    yield text
+
+def _stream_and_cache(chat, messages, key):
+    tokens = []
+    try:
+        for token in client.stream_chat(messages, on_done=chat.record):
+            tokens.append(token)
+            yield token
+    except Exception as e:
+        yield f"Error calling Ollama API: {e}"
+        return
+    # Only complete generations are cached; a stream closed early never reaches here
+    if key and tokens:
+        cache.put(key, "".join(tokens))
+
+def get_interview_questions(transcript, stream=False, use_cache=True):
+    return _complete(follow_up_chat, FOLLOW_UP_PROMPT, stream=stream, use_cache=use_cache, transcript=transcript)
+
+def getReportForInterview(transcript, use_cache=True):
+    return _complete(report_chat, REPORT_PROMPT, use_cache=use_cache, transcript=transcript)
+
+def summarize_answer(transcript, use_cache=True):
+    return _complete(digest_chat, DIGEST_PROMPT, use_cache=use_cache, transcript=transcript)
+
+def get_report_from_digests(digests, use_cache=True):
+    answers = "\n\n".join(f"Answer {i}:\n{digest.strip()}" for i, digest in enumerate(digests, 1))
+    return _complete(digest_report_chat, DIGEST_REPORT_PROMPT, use_cache=use_cache, answers=answers)
+
+class Draft:
+    # One speculative follow-up generation running in the background. Tokens are buffered so
+    # a caller can attach at any point and replay them before following the live stream.
+    def __init__(self, transcript, on_finished=None):
+        self.transcript = transcript
+        self.done = False
+        self.cancelled = False
+        self._tokens = []
+        self._cond = threading.Condition()
+        self._on_finished = on_finished
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        stream = None
+        try:
+            stream = get_interview_questions(self.transcript, stream=True, use_cache=False)
+            for token in stream:
+                if self.cancelled:
+                    break
+                with self._cond:
+                    self._tokens.append(token)
+                    self._cond.notify_all()
+        finally:
+            # Closing the generator drops the HTTP stream, which stops Ollama generating
+            if stream is not None:
+                stream.close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            if self._on_finished:
+                self._on_finished(self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def tokens(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._tokens) and not self.done:
+                    self._cond.wait()
+                if i >= len(self._tokens):
+                    return
+                token = self._tokens[i]
+            i += 1
+            yield token
+
+class FollowUpDrafter:
+    # Drafts follow-ups from the phrases recognized so far while the candidate is still talking.
+    # At most one draft runs at a time; newer text supersedes it and is drafted once it stops.
+    def __init__(self):
+        self._draft = None
+        self._latest = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(transcript):
+        return " ".join(transcript.split())
+
+    def update(self, transcript):
+        transcript = self._normalize(transcript)
+        with self._lock:
+            self._latest = transcript
+            if self._draft and self._draft.transcript == transcript and not self._draft.cancelled:
+                return
+            if self._draft and not self._draft.done:
+                self._draft.cancel()
+                return
+            self._draft = Draft(transcript, self._draft_finished)
+
+    def _draft_finished(self, draft):
+        with self._lock:
+            if draft is self._draft and draft.cancelled and self._latest:
+                self._draft = Draft(self._latest, self._draft_finished)
+
+    def finalize(self, transcript):
+        # Returns a token stream for the final answer, reusing the draft if it matches. Drafts
+        # of this answer are built from its leading phrases; any other draft belongs to a later
+        # question and is left running.
+        transcript = self._normalize(transcript)
+        with self._lock:
+            if self._latest is not None and transcript.startswith(self._latest):
+                self._latest = None
+            draft = self._draft
+            if draft and transcript.startswith(draft.transcript):
+                self._draft = None
+            else:
+                draft = None
+        if draft and draft.transcript == transcript and not draft.cancelled:
+            return self._replay(draft)
+        if draft:
+            draft.cancel()
+        return get_interview_questions(transcript, stream=True)
+
+    @staticmethod
+    def _replay(draft):
+        # Closing the replay early cancels the draft too, so it stops holding an Ollama slot
+        try:
+            yield from draft.tokens()
+        finally:
+            if not draft.done:
+                draft.cancel()
+
+    def cancel(self):
+        with self._lock:
+            self._latest = None
+            if self._draft:
+                self._draft.cancel()
+            self._draft = None
+
+def check_ollama_running():
+    return client.is_running()
+
+def warm_up_model():
+    # Preloads the model so the first follow-up doesn't pay the cold load
+    client.warm_up()
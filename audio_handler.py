@@ -1,39 +1,528 @@
+import json
+import os
 import queue
 import threading
+import time
+from collections import namedtuple
+import numpy as np
 import speech_recognition as sr
+from metrics import tracker
 
-class AudioStreamHandler:
+RECOGNITION_WORKERS = 3
+
+# Speech-to-text engine: "google" (online), "vosk" or "whisper" (offline, CPU)
+ASR_BACKEND = os.getenv("HIRESCOPE_ASR_BACKEND", "google")
+VOSK_MODEL_PATH = os.getenv("HIRESCOPE_VOSK_MODEL", "models/vosk-model-small-en-us-0.15")
+WHISPER_MODEL = os.getenv("HIRESCOPE_WHISPER_MODEL", "base.en")
+ASR_SAMPLE_RATE = 16000
+
+# Microphone capture: "ring" streams through sounddevice into a fixed ring buffer and cuts
+# segments at pauses; "listen" uses speech_recognition's Microphone and listen()
+CAPTURE_MODE = os.getenv("HIRESCOPE_CAPTURE", "ring")
+# Seconds of audio the ring buffer holds; segments must be transcribed before it wraps round
+RING_SECONDS = 120
+
+# seq orders phrases as they were spoken; started/ended are capture timestamps
+Phrase = namedtuple("Phrase", ["seq", "started", "ended", "text"])
+
+_models = {}
+_models_lock = threading.Lock()
+
+def _load_model(key, loader):
+    # Offline models are expensive to load; load each one once per process and share it
+    with _models_lock:
+        if key not in _models:
+            _models[key] = loader()
+        return _models[key]
+
+class RecognizerBackend:
+    # Number of queued segments a worker may hand to transcribe_batch at once
+    batch_size = 1
+
+    def transcribe(self, audio):
+        raise NotImplementedError
+
+    def transcribe_batch(self, segments):
+        # Returns one entry per segment: the text, or the exception raised for it
+        results = []
+        for audio in segments:
+            try:
+                results.append(self.transcribe(audio))
+            except Exception as e:
+                results.append(e)
+        return results
+
+class GoogleBackend(RecognizerBackend):
     def __init__(self):
         self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+
+    def transcribe(self, audio):
+        return self.recognizer.recognize_google(audio)
+
+class VoskBackend(RecognizerBackend):
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("The vosk backend needs the vosk package: pip install vosk")
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = _load_model(("vosk", model_path), lambda: vosk.Model(model_path))
+
+    def transcribe(self, audio):
+        recognizer = self._vosk.KaldiRecognizer(self.model, ASR_SAMPLE_RATE)
+        # bytes() because ring-buffer segments hand over a memoryview, which vosk doesn't take
+        recognizer.AcceptWaveform(bytes(audio.get_raw_data(convert_rate=ASR_SAMPLE_RATE, convert_width=2)))
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+class FasterWhisperBackend(RecognizerBackend):
+    batch_size = 4
+    # Silence inserted between segments when several are decoded in one pass
+    batch_gap = 0.5
+
+    def __init__(self, model_name=WHISPER_MODEL):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("The whisper backend needs faster-whisper: pip install faster-whisper")
+        # local_files_only keeps air-gapped machines from trying to reach the model hub
+        self.model = _load_model(
+            ("whisper", model_name),
+            lambda: WhisperModel(model_name, device="cpu", compute_type="int8", local_files_only=True),
+        )
+
+    def _samples(self, audio):
+        raw = audio.get_raw_data(convert_rate=ASR_SAMPLE_RATE, convert_width=2)
+        return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def transcribe(self, audio):
+        return self.transcribe_batch([audio])[0]
+
+    def transcribe_batch(self, segments):
+        # Decode all segments in one pass: join them with short silences and split the
+        # words back out by timestamp
+        gap = np.zeros(int(self.batch_gap * ASR_SAMPLE_RATE), dtype=np.float32)
+        pieces, bounds, offset = [], [], 0.0
+        for audio in segments:
+            samples = self._samples(audio)
+            pieces.extend([samples, gap])
+            duration = len(samples) / ASR_SAMPLE_RATE
+            bounds.append(offset + duration + self.batch_gap / 2)
+            offset += duration + self.batch_gap
+        try:
+            decoded, _ = self.model.transcribe(
+                np.concatenate(pieces), language="en", beam_size=1, word_timestamps=len(segments) > 1
+            )
+            words = [[] for _ in segments]
+            for piece in decoded:
+                if len(segments) == 1:
+                    words[0].append(piece.text)
+                    continue
+                for word in piece.words:
+                    index = next((i for i, end in enumerate(bounds) if word.start < end), len(bounds) - 1)
+                    words[index].append(word.word)
+        except Exception as e:
+            return [e] * len(segments)
+        results = []
+        for parts in words:
+            text = "".join(parts).strip()
+            results.append(text if text else sr.UnknownValueError())
+        return results
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "vosk": VoskBackend,
+    "whisper": FasterWhisperBackend,
+}
+
+def make_backend(name=ASR_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+class VoiceActivityDetector:
+    def __init__(self, frame_ms=30, energy_ratio=0.5, max_zero_crossing=0.35, min_speech_ms=150, padding_ms=200):
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.max_zero_crossing = max_zero_crossing
+        self.min_speech_ms = min_speech_ms
+        self.padding_ms = padding_ms
+        self.frames_seen = 0
+        self.frames_dropped = 0
+        self.segments_dropped = 0
+        self.segments_passed = 0
+
+    def frame_length(self, sample_rate):
+        return max(1, sample_rate * self.frame_ms // 1000)
+
+    def classify(self, samples, sample_rate, energy_threshold):
+        # Per-frame RMS energy, and whether each frame looks like speech
+        frame_len = self.frame_length(sample_rate)
+        count = len(samples) // frame_len
+        frames = samples[:count * frame_len].reshape(count, frame_len).astype(np.float32)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zero_crossing = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        # Voiced speech is loud with a low crossing rate; clicks and hiss cross zero constantly
+        return energy, (energy > energy_threshold) & (zero_crossing < self.max_zero_crossing)
+
+    def process(self, audio, energy_threshold):
+        # Returns the segment trimmed to its speech, or None if it holds no speech at all
+        samples = np.frombuffer(audio.get_raw_data(convert_width=2), dtype=np.int16)
+        frame_len = self.frame_length(audio.sample_rate)
+        count = len(samples) // frame_len
+        self.frames_seen += count
+        if count == 0:
+            self.segments_dropped += 1
+            return None
+
+        _, is_speech = self.classify(samples, audio.sample_rate, energy_threshold * self.energy_ratio)
+        speech = np.flatnonzero(is_speech)
+
+        if len(speech) * self.frame_ms < self.min_speech_ms:
+            self.frames_dropped += count
+            self.segments_dropped += 1
+            return None
+
+        padding = self.padding_ms // self.frame_ms
+        first = max(0, int(speech[0]) - padding)
+        last = min(count, int(speech[-1]) + padding + 1)
+        self.frames_dropped += count - (last - first)
+        self.segments_passed += 1
+        end = len(samples) if last == count else last * frame_len
+        return sr.AudioData(samples[first * frame_len:end].tobytes(), audio.sample_rate, 2)
+
+    def stats(self):
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_dropped": self.frames_dropped,
+            "recognizer_calls_saved": self.segments_dropped,
+            "segments_passed": self.segments_passed,
+        }
+
+class RingBuffer:
+    # Fixed-size int16 ring addressed by absolute sample index. Every sample is stored twice,
+    # capacity apart, so any span of up to capacity samples is one contiguous view.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = np.zeros(2 * capacity, dtype=np.int16)
+        self.written = 0
+
+    def write(self, samples):
+        pos = self.written % self.capacity
+        head = min(len(samples), self.capacity - pos)
+        tail = len(samples) - head
+        for base in (0, self.capacity):
+            self._buffer[base + pos:base + pos + head] = samples[:head]
+            self._buffer[base:base + tail] = samples[head:]
+        # Published last, so readers never see a half-written block
+        self.written += len(samples)
+
+    def view(self, start, end):
+        if self.overwritten(start) or end > self.written:
+            raise IndexError(f"samples {start}-{end} are not in the buffer")
+        offset = start % self.capacity
+        return self._buffer[offset:offset + end - start]
+
+    def overwritten(self, start, margin=0):
+        # True once the writer has lapped start (or is within margin samples of doing so)
+        return self.written + margin - start > self.capacity
+
+class RingSegment(sr.AudioData):
+    # AudioData backed by a view into the ring buffer rather than a copy of it
+    def __init__(self, ring, start, end, sample_rate):
+        super().__init__(ring.view(start, end).data.cast("B"), sample_rate, 2)
+        self.ring = ring
+        self.start = start
+
+    def overwritten(self):
+        # A second of margin covers a block the capture callback may be writing right now
+        return self.ring.overwritten(self.start, margin=self.sample_rate)
+
+class SoundDeviceSource:
+    # Continuous microphone capture into a RingBuffer. Entering starts the stream and leaving
+    # stops it; the ring and its sample count carry on across entries.
+    def __init__(self, sample_rate=ASR_SAMPLE_RATE, seconds=RING_SECONDS, device=None, block_ms=30):
+        try:
+            import sounddevice
+        except ImportError:
+            raise RuntimeError("Ring-buffer capture needs sounddevice: pip install sounddevice (or set HIRESCOPE_CAPTURE=listen)")
+        self.sample_rate = sample_rate
+        self.ring = RingBuffer(sample_rate * seconds)
+        self.overflows = 0
+        self.calibrated = False
+        self._data = threading.Event()
+        self._base_sample = 0
+        self._base_time = time.time()
+        self.stream = sounddevice.InputStream(
+            samplerate=sample_rate, channels=1, dtype="int16", device=device,
+            blocksize=sample_rate * block_ms // 1000, callback=self._callback,
+        )
+
+    def __enter__(self):
+        self._base_sample = self.ring.written
+        self._base_time = time.time()
+        self.stream.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stream.stop()
+
+    def _callback(self, indata, frames, time_info, status):
+        # Runs on the audio thread: copy the block into the ring and get out
+        if status.input_overflow:
+            self.overflows += 1
+        self.ring.write(indata[:, 0])
+        self._data.set()
+
+    def wait(self, timeout):
+        self._data.wait(timeout)
+        self._data.clear()
+
+    def time_at(self, sample):
+        return self._base_time + (sample - self._base_sample) / self.sample_rate
+
+class AudioStreamHandler:
+    def __init__(self, workers=RECOGNITION_WORKERS, backend=None, use_vad=True, source=None, calibrate=True,
+                 max_segment_seconds=30):
+        self.recognizer = sr.Recognizer()
+        self.backend = backend or make_backend()
+        self.vad = VoiceActivityDetector() if use_vad else None
+        # A SoundDeviceSource, or any speech_recognition AudioSource; an sr.AudioFile replays a recording
+        if source is None:
+            source = SoundDeviceSource() if CAPTURE_MODE == "ring" else sr.Microphone()
+        self.source = source
+        self.calibrate = calibrate
+        # Ring capture splits speech that runs this long without a pause at its quietest point
+        self.max_segment_seconds = max_segment_seconds
         self.audio_queue = queue.Queue()
+        self.segment_queue = queue.Queue()
         self.listening = False
         self._stop_event = threading.Event()
+        self._capture_thread = None
+        self._seq = 0
+        self._next_seq = 0
+        self._finished = {}
+        self._order_lock = threading.Lock()
+        # Optional callback for each phrase as it is released, in order; keep it quick
+        self.on_phrase = None
+        self._workers = workers
+        for _ in range(workers):
+            threading.Thread(target=self._recognize_segments, daemon=True).start()
 
     def start_listening(self):
         if self.listening:
             return
         self.listening = True
         self._stop_event.clear()
-        threading.Thread(target=self._listen_in_background, daemon=True).start()
+        self._capture_thread = threading.Thread(target=self._listen_in_background, daemon=True)
+        self._capture_thread.start()
 
     def stop_listening(self):
         self._stop_event.set()
         self.listening = False
 
+    def close(self):
+        # Stops capture and lets the recognition workers exit once the queue is drained
+        self.stop_listening()
+        for _ in range(self._workers):
+            self.segment_queue.put(None)
+
+    def wait_until_idle(self, timeout=None):
+        # Waits for the capture loop to exit and every captured segment to be transcribed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout)
+            if self._capture_thread.is_alive():
+                return False
+        while True:
+            with self._order_lock:
+                if self._next_seq >= self._seq:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
     def _listen_in_background(self):
-        with self.microphone as source:
-            self.recognizer.adjust_for_ambient_noise(source)
+        if isinstance(self.source, SoundDeviceSource):
+            self._capture_from_ring()
+            return
+        with self.source as source:
+            if self.calibrate:
+                with tracker.span("calibration"):
+                    self.recognizer.adjust_for_ambient_noise(source)
             while not self._stop_event.is_set():
                 try:
+                    started = time.time()
                     audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=15)
-                    transcript = self.recognizer.recognize_google(audio)
-                    self.audio_queue.put(transcript)
+                    ended = time.time()
+                    tracker.record("listen", ended - started)
+                    if not audio.frame_data:
+                        # Only file sources run dry; the recording has been fully captured
+                        self.listening = False
+                        break
+                    if self.vad:
+                        audio = self.vad.process(audio, self.recognizer.energy_threshold)
+                        if audio is None:
+                            continue
+                    self._enqueue_segment(audio, started, ended)
                 except sr.WaitTimeoutError:
                     continue
-                except sr.UnknownValueError:
-                    # Can't understand audio, skip
-                    self.audio_queue.put(None)
                 except Exception as e:
-                    self.audio_queue.put(f"Error: {e}")
-    
\ No newline at end of file
+                    self._enqueue_segment(e, time.time(), time.time())
+
+    def _capture_from_ring(self):
+        # Reads the ring behind the capture callback, classifying 30 ms frames as speech or
+        # silence, and cuts a segment once speech is followed by pause_threshold of silence.
+        # Segments are views into the ring, so nothing between them is dropped or copied.
+        vad = self.vad or VoiceActivityDetector()
+        recognizer = self.recognizer
+        with self.source as source:
+            ring, rate = source.ring, source.sample_rate
+            frame_len = vad.frame_length(rate)
+            frame_seconds = frame_len / rate
+            pause_frames = max(1, round(recognizer.pause_threshold / frame_seconds))
+            padding = vad.padding_ms // vad.frame_ms * frame_len
+            min_speech_frames = max(1, vad.min_speech_ms // vad.frame_ms)
+            max_frames = round(self.max_segment_seconds / frame_seconds)
+            split_window = min(max_frames, round(3 / frame_seconds))
+            damping = recognizer.dynamic_energy_adjustment_damping ** frame_seconds
+            pos = ring.written
+
+            if self.calibrate and not source.calibrated:
+                # Once per source; afterwards the dynamic threshold tracks the noise floor. The
+                # answer may already have started, so take the floor from the quietest frames,
+                # and segment this second like any other: it is still in the ring.
+                with tracker.span("calibration"):
+                    while ring.written < pos + rate and not self._stop_event.is_set():
+                        source.wait(0.1)
+                    end = pos + (ring.written - pos) // frame_len * frame_len
+                    if end > pos:
+                        energy, _ = vad.classify(ring.view(pos, end), rate, recognizer.energy_threshold)
+                        recognizer.energy_threshold = float(np.percentile(energy, 10)) * recognizer.dynamic_energy_ratio
+                        source.calibrated = True
+
+            # The open segment: where it starts, and per-frame energy/speech from its first speech frame on
+            start = None
+            frames_from = 0
+            energies, voiced = [], []
+            last_speech = 0
+            floor = pos
+
+            def cut(end):
+                nonlocal start, floor
+                if sum(voiced) >= min_speech_frames:
+                    vad.segments_passed += 1
+                    self._enqueue_ring_segment(source, start, end)
+                else:
+                    vad.segments_dropped += 1
+                floor = end
+                start = None
+                energies.clear()
+                voiced.clear()
+
+            while True:
+                stopping = self._stop_event.is_set()
+                if not stopping:
+                    source.wait(0.1)
+                if ring.overwritten(pos, margin=rate):
+                    # This reader fell a whole buffer behind; resume at the newest audio
+                    if start is not None:
+                        cut(pos)
+                    pos = floor = ring.written - ring.written % frame_len
+                count = (ring.written - pos) // frame_len
+                if count:
+                    energy, speech = vad.classify(ring.view(pos, pos + count * frame_len), rate, recognizer.energy_threshold)
+                    vad.frames_seen += count
+                    for i in range(count):
+                        frame = pos + i * frame_len
+                        if start is None:
+                            if not speech[i]:
+                                vad.frames_dropped += 1
+                                if recognizer.dynamic_energy_threshold:
+                                    # Track the noise floor the way listen() does between phrases
+                                    target = float(energy[i]) * recognizer.dynamic_energy_ratio
+                                    recognizer.energy_threshold = recognizer.energy_threshold * damping + target * (1 - damping)
+                                continue
+                            start = max(floor, frame - padding)
+                            frames_from = frame
+                        energies.append(float(energy[i]))
+                        voiced.append(bool(speech[i]))
+                        if speech[i]:
+                            last_speech = frame + frame_len
+                        elif frame + frame_len - last_speech >= pause_frames * frame_len:
+                            cut(min(last_speech + padding, frame + frame_len))
+                            continue
+                        if len(energies) >= max_frames:
+                            # No pause yet: split at the quietest frame of the last few seconds
+                            quietest = max(1, len(energies) - split_window + int(np.argmin(energies[-split_window:])))
+                            split = frames_from + quietest * frame_len
+                            rest_energies, rest_voiced = energies[quietest:], voiced[quietest:]
+                            cut(split)
+                            start = frames_from = split
+                            energies.extend(rest_energies)
+                            voiced.extend(rest_voiced)
+                    pos += count * frame_len
+                if stopping:
+                    break
+            if start is not None:
+                cut(min(last_speech + padding, pos))
+
+    def _enqueue_ring_segment(self, source, start, end):
+        started, ended = source.time_at(start), source.time_at(end)
+        tracker.record("listen", ended - started)
+        self._enqueue_segment(RingSegment(source.ring, start, end, source.sample_rate), started, ended)
+
+    def _enqueue_segment(self, audio, started, ended):
+        with self._order_lock:
+            seq = self._seq
+            self._seq += 1
+        self.segment_queue.put((seq, started, ended, audio))
+
+    def _recognize_segments(self):
+        while True:
+            batch = [self.segment_queue.get()]
+            if batch[0] is None:
+                return
+            # Pick up whatever else is already waiting so batching backends decode it together
+            while len(batch) < self.backend.batch_size:
+                try:
+                    segment = self.segment_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if segment is None:
+                    # Leave the shutdown marker for the next loop round
+                    self.segment_queue.put(None)
+                    break
+                batch.append(segment)
+            audio = [segment[3] for segment in batch if not isinstance(segment[3], Exception)]
+            recognition_started = time.perf_counter()
+            results = iter(self.backend.transcribe_batch(audio) if audio else [])
+            if audio:
+                tracker.record("recognition", time.perf_counter() - recognition_started)
+            for seq, started, ended, segment in batch:
+                result = segment if isinstance(segment, Exception) else next(results)
+                if isinstance(segment, RingSegment) and segment.overwritten():
+                    result = RuntimeError("capture buffer wrapped before this segment was transcribed")
+                if isinstance(result, sr.UnknownValueError):
+                    # Can't understand audio, skip
+                    text = None
+                elif isinstance(result, Exception):
+                    text = f"Error: {result}"
+                else:
+                    text = result
+                self._emit(Phrase(seq, started, ended, text))
+
+    def _emit(self, phrase):
+        # Workers finish out of order; release phrases to audio_queue strictly by seq
+        with self._order_lock:
+            self._finished[phrase.seq] = phrase
+            while self._next_seq in self._finished:
+                released = self._finished.pop(self._next_seq)
+                self.audio_queue.put(released)
+                self._next_seq += 1
+                if self.on_phrase:
+                    self.on_phrase(released)
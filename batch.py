@@ -0,0 +1,168 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import speech_recognition as sr
+import ai_service
+from audio_handler import ASR_BACKEND, BACKENDS, AudioStreamHandler, make_backend
+from scheduler import LLM_CONCURRENCY
+
+# Headless re-scoring of recorded interviews:
+#
+#   python main.py batch recordings/ --output reports/
+#
+# Audio files are transcribed on a process pool, then each transcript is summarized and
+# reported on a bounded pool of LLM threads. Every finished interview is recorded in
+# summary.csv straight away, so an interrupted run picks up where it stopped.
+
+AUDIO_EXTENSIONS = (".wav", ".aif", ".aiff", ".flac")
+TRANSCRIPT_EXTENSIONS = (".txt",)
+SUMMARY_FIELDS = ["interview", "source", "words", "status", "seconds", "report"]
+# Long transcripts are reported on in chunks of roughly this many words, like the GUI's digests
+CHUNK_WORDS = 400
+
+def transcribe_file(path, backend_name):
+    # Runs in a worker process, which loads its own ASR model
+    handler = AudioStreamHandler(workers=1, backend=make_backend(backend_name), source=sr.AudioFile(path), calibrate=False)
+    try:
+        handler.start_listening()
+        handler.wait_until_idle()
+        phrases = []
+        while not handler.audio_queue.empty():
+            phrase = handler.audio_queue.get()
+            if phrase.text and not phrase.text.startswith("Error: "):
+                phrases.append(phrase.text)
+        return " ".join(phrases)
+    finally:
+        handler.close()
+
+def chunk_transcript(transcript, size=CHUNK_WORDS):
+    words = transcript.split()
+    return [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+def build_report(transcript):
+    digests = [ai_service.summarize_answer(chunk) for chunk in chunk_transcript(transcript)]
+    failed = next((digest for digest in digests if digest.startswith("Error calling Ollama API")), None)
+    if failed:
+        raise RuntimeError(failed)
+    report = ai_service.get_report_from_digests(digests)
+    if report.startswith("Error calling Ollama API"):
+        raise RuntimeError(report)
+    return report
+
+def find_interviews(directory):
+    interviews = {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in AUDIO_EXTENSIONS + TRANSCRIPT_EXTENSIONS:
+            # A transcript beside a recording wins; there's nothing left to transcribe
+            if stem not in interviews or ext.lower() in TRANSCRIPT_EXTENSIONS:
+                interviews[stem] = os.path.join(directory, name)
+    return interviews
+
+def load_summary(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["interview"]: row for row in csv.DictReader(f)}
+
+def save_summary(path, rows):
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for name in sorted(rows):
+            writer.writerow(rows[name])
+    os.replace(tmp, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py batch", description="Transcribe and report on recorded interviews")
+    parser.add_argument("input", help="directory of recordings (.wav/.aiff/.flac) and/or transcripts (.txt)")
+    parser.add_argument("--output", help="where reports and summary.csv go (default: INPUT/reports)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="transcription processes")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY, help="LLM requests in flight")
+    parser.add_argument("--backend", default=ASR_BACKEND, choices=list(BACKENDS), help="speech-to-text engine")
+    args = parser.parse_args(argv)
+
+    # Absolute paths in summary.csv, so a rerun from another directory still finds finished reports
+    output = os.path.abspath(args.output or os.path.join(args.input, "reports"))
+    os.makedirs(output, exist_ok=True)
+    summary_path = os.path.join(output, "summary.csv")
+    rows = load_summary(summary_path)
+
+    interviews = find_interviews(os.path.abspath(args.input))
+    pending = {
+        name: path for name, path in interviews.items()
+        if rows.get(name, {}).get("status") != "done" or not os.path.exists(os.path.join(output, os.path.basename(rows[name]["report"])))
+    }
+    total = len(interviews)
+    done = total - len(pending)
+    print(f"{total} interviews found, {done} already done, {len(pending)} to process", flush=True)
+    if not pending:
+        return
+
+    ai_service.client = ai_service.OllamaClient(max_in_flight=args.llm_concurrency)
+    started = {name: time.time() for name in pending}
+
+    def finish(name, status, words=0, report_path=""):
+        nonlocal done
+        done += 1
+        rows[name] = {
+            "interview": name,
+            "source": interviews[name],
+            "words": words,
+            "status": status,
+            "seconds": round(time.time() - started[name], 1),
+            "report": report_path,
+        }
+        save_summary(summary_path, rows)
+        print(f"[{done}/{total}] {name}: {status}", flush=True)
+
+    def report_on(name, transcript):
+        report_path = os.path.join(output, f"{name}.report.txt")
+        try:
+            report = build_report(transcript)
+        except Exception as e:
+            return name, f"error: {e}", len(transcript.split()), ""
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(report)
+        return name, "done", len(transcript.split()), report_path
+
+    with ProcessPoolExecutor(max_workers=args.workers) as asr_pool, \
+            ThreadPoolExecutor(max_workers=args.llm_concurrency) as llm_pool:
+        jobs = {}
+        for name, path in pending.items():
+            transcript_path = os.path.join(output, f"{name}.transcript.txt")
+            if path.lower().endswith(TRANSCRIPT_EXTENSIONS) or os.path.exists(transcript_path):
+                # Typed transcripts, and recordings transcribed by an earlier run, skip ASR
+                source = path if path.lower().endswith(TRANSCRIPT_EXTENSIONS) else transcript_path
+                with open(source, encoding="utf-8") as f:
+                    jobs[llm_pool.submit(report_on, name, f.read())] = ("report", name)
+            else:
+                jobs[asr_pool.submit(transcribe_file, path, args.backend)] = ("transcribe", name)
+
+        while jobs:
+            finished, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, name = jobs.pop(future)
+                if stage == "report":
+                    finish(*future.result())
+                    continue
+                try:
+                    transcript = future.result()
+                except Exception as e:
+                    finish(name, f"error: {e}")
+                    continue
+                if not transcript.strip():
+                    finish(name, "error: no speech recognized")
+                    continue
+                with open(os.path.join(output, f"{name}.transcript.txt"), "w", encoding="utf-8") as f:
+                    f.write(transcript)
+                print(f"  transcribed {name} ({len(transcript.split())} words)", flush=True)
+                jobs[llm_pool.submit(report_on, name, transcript)] = ("report", name)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
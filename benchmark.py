@@ -0,0 +1,207 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import tempfile
+import time
+import wave
+from collections import defaultdict
+import numpy as np
+import speech_recognition as sr
+import ai_service
+from audio_handler import AudioStreamHandler, RecognizerBackend, BACKENDS, make_backend
+from fake_ollama import FakeOllamaServer
+from metrics import percentile
+# Offline latency benchmark: replays WAV fixtures in real time through AudioStreamHandler and sends each
+# Offline latency benchmark: replays WAV fixtures through AudioStreamHandler and sends each
+# answer to a stand-in Ollama server, then reports p50/p95 latency per stage as JSON.
+#
+#   python benchmark.py fixtures/ --output bench.json
+#   python benchmark.py --synthetic 5 --token-latency 0.05
+
+class SimulatedBackend(RecognizerBackend):
+    # Local stand-in recognizer: takes time in proportion to the audio length and returns filler words
+    def __init__(self, seconds_per_audio_second=0.1, words_per_second=2.5):
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.words_per_second = words_per_second
+
+    def transcribe(self, audio):
+        duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        time.sleep(duration * self.seconds_per_audio_second)
+        return " ".join(["answer"] * max(1, int(duration * self.words_per_second)))
+
+class RealTimeAudioFile(sr.AudioFile):
+    # Hands out audio no faster than it was recorded, so listen() returns when the speech ends on
+    # the wall clock, as it would from a microphone, instead of reading the whole file at once
+    def __enter__(self):
+        super().__enter__()
+        self.stream = PacedStream(self.stream, self.SAMPLE_RATE * self.SAMPLE_WIDTH)
+        return self
+
+class PacedStream:
+    def __init__(self, stream, bytes_per_second):
+        self.stream = stream
+        self.bytes_per_second = bytes_per_second
+        self.started = None
+        self.delivered = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if self.started is None:
+            self.started = time.time()
+        self.delivered += len(data)
+        delay = self.started + self.delivered / self.bytes_per_second - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+def summarize(samples):
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        }
+        for stage, values in sorted(samples.items()) if values
+    }
+
+def write_synthetic_fixtures(directory, count, sample_rate=16000, seed=0):
+    # Voiced-sounding bursts (a harmonic stack) separated by pauses, enough to pass the VAD
+    rng = np.random.default_rng(seed)
+    paths = []
+    for n in range(count):
+        pieces = [rng.normal(0, 30, int(0.5 * sample_rate))]
+        for _ in range(rng.integers(2, 5)):
+            t = np.arange(int(rng.uniform(1.0, 3.0) * sample_rate)) / sample_rate
+            pitch = rng.uniform(110, 220)
+            tone = sum(np.sin(2 * np.pi * pitch * h * t) / h for h in range(1, 5))
+            pieces.append(tone * 3000 + rng.normal(0, 30, len(t)))
+            pieces.append(rng.normal(0, 30, int(rng.uniform(1.0, 1.5) * sample_rate)))
+        samples = np.clip(np.concatenate(pieces), -32768, 32767).astype(np.int16)
+        path = os.path.join(directory, f"synthetic_{n:02d}.wav")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(samples.tobytes())
+        paths.append(path)
+    return paths
+
+def run_fixture(path, backend, workers, samples):
+    handler = AudioStreamHandler(workers=workers, backend=backend, source=RealTimeAudioFile(path), calibrate=False)
+    texts = []
+    end_of_speech = arrived = None
+    try:
+        handler.start_listening()
+        while True:
+            try:
+                phrase = handler.audio_queue.get(timeout=0.05)
+            except queue.Empty:
+                if handler.wait_until_idle(timeout=0) and handler.audio_queue.empty():
+                    break
+                continue
+            arrived = time.time()
+            samples["capture"].append(phrase.ended - phrase.started)
+            samples["asr"].append(arrived - phrase.ended)
+            end_of_speech = phrase.ended
+            if phrase.text:
+                texts.append(phrase.text)
+    finally:
+        # Each fixture gets its own handler; let its recognition workers exit
+        handler.close()
+
+    if not texts:
+        return False
+    # The loop only ends once the fixture's trailing silence has been played, so time the answer
+    # from the last transcript's arrival rather than from here
+    transcript_ready = arrived - end_of_speech
+    samples["transcript_ready"].append(transcript_ready)
+
+    requested = time.time()
+    first_token = None
+    for _ in ai_service.get_interview_questions(" ".join(texts), stream=True, use_cache=False):
+        if first_token is None:
+            first_token = time.time()
+    done = time.time()
+    samples["llm_first_token"].append(first_token - requested)
+    samples["llm_full_response"].append(done - requested)
+    samples["end_to_first_token"].append(transcript_ready + first_token - requested)
+    samples["end_to_full_response"].append(transcript_ready + done - requested)
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark for HireScope AI")
+    parser.add_argument("fixtures", nargs="?", help="directory of .wav recordings")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many synthetic recordings instead")
+    parser.add_argument("--backend", default="simulated", choices=["simulated"] + list(BACKENDS))
+    parser.add_argument("--asr-latency", type=float, default=0.1, help="simulated recognizer seconds per audio second")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--ollama-url", help="benchmark against this server instead of the built-in fake")
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.synthetic:
+            paths = write_synthetic_fixtures(scratch, args.synthetic)
+        elif args.fixtures:
+            paths = sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+        else:
+            parser.error("give a fixtures directory or --synthetic N")
+        if not paths:
+            parser.error(f"no .wav files found in {args.fixtures}")
+
+        fake = None
+        if args.ollama_url:
+            ai_service.client = ai_service.OllamaClient(base_url=args.ollama_url)
+        else:
+            fake = FakeOllamaServer(
+                first_token_latency=args.first_token_latency, token_latency=args.token_latency, tokens=args.tokens
+            ).start()
+            ai_service.client = ai_service.OllamaClient(base_url=fake.url)
+
+        if args.backend == "simulated":
+            backend = SimulatedBackend(seconds_per_audio_second=args.asr_latency)
+        else:
+            backend = make_backend(args.backend)
+
+        samples = defaultdict(list)
+        skipped = []
+        try:
+            for _ in range(args.runs):
+                for path in paths:
+                    if not run_fixture(path, backend, args.workers, samples):
+                        skipped.append(os.path.basename(path))
+        finally:
+            if fake:
+                fake.stop()
+
+    results = {
+        "config": {
+            "backend": args.backend,
+            "workers": args.workers,
+            "runs": args.runs,
+            "ollama": args.ollama_url or "fake",
+            "first_token_latency": args.first_token_latency,
+            "token_latency": args.token_latency,
+            "tokens": args.tokens,
+        },
+        "fixtures": [os.path.basename(path) for path in paths],
+        "skipped": skipped,
+        "stages": summarize(samples),
+    }
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
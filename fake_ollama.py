@@ -0,0 +1,127 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for the Ollama HTTP API, used by the benchmarks so they run without a model.
+# It answers GET / like Ollama does and streams a canned response from /api/generate and
+# /api/chat with configurable latency per token.
+
+class FakeOllamaServer:
+    def __init__(self, host="127.0.0.1", port=0, first_token_latency=0.2, token_latency=0.02, tokens=60):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def response_tokens(self):
+        return [f"token{i} " for i in range(self.tokens)]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunk(self, body):
+                data = (json.dumps(body) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                data = b"Ollama is running"
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, payload, text, done):
+                body = {"model": payload.get("model"), "done": done}
+                if self.path == "/api/chat":
+                    body["message"] = {"role": "assistant", "content": text}
+                else:
+                    body["response"] = text
+                if done:
+                    # Rough token count of what the model had to read
+                    prompt = payload.get("prompt") or " ".join(m["content"] for m in payload.get("messages", []))
+                    body["prompt_eval_count"] = len(prompt.split())
+                    body["eval_count"] = server.tokens
+                return body
+
+            def do_POST(self):
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._send_json(404, {"error": "not found"})
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                if "prompt" not in payload and "messages" not in payload:
+                    # Ollama answers an empty request by loading the model and returning at once
+                    time.sleep(server.first_token_latency)
+                    self._send_json(200, {"model": payload.get("model"), "response": "", "done": True, "done_reason": "load"})
+                    return
+                tokens = server.response_tokens()
+                time.sleep(server.first_token_latency)
+                if not payload.get("stream", True):
+                    time.sleep(server.token_latency * (len(tokens) - 1))
+                    self._send_json(200, self._chunk(payload, "".join(tokens), True))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, token in enumerate(tokens):
+                        if i:
+                            time.sleep(server.token_latency)
+                        self._send_chunk(self._chunk(payload, token, False))
+                    self._send_chunk(self._chunk(payload, "", True))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the generation
+                    pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stand-in Ollama server with synthetic latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    fake = FakeOllamaServer(args.host, args.port, args.first_token_latency, args.token_latency, args.tokens)
+    print(f"Fake Ollama listening on {fake.url}")
+    fake.httpd.serve_forever()
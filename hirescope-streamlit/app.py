@@ -1,5 +1,7 @@
 import streamlit as st
 import speech_recognition as sr
+import queue
+import threading
 import time
 import os
 from dotenv import load_dotenv
@@ -9,6 +11,14 @@ import google.generativeai as genai
 load_dotenv()
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
+# ────────────────────────────────
+# Shared Resources (created once per server process, not on every rerun)
+# ────────────────────────────────
+
+@st.cache_resource
+def get_model():
+    return genai.GenerativeModel('gemini-1.5-flash')
+
 # ────────────────────────────────
 # AI PROMPT FUNCTIONS
 # ────────────────────────────────
@@ -24,8 +34,7 @@ Response Rating:
 
 Interviewer questions:
 """
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    response = model.generate_content(prompt)
+    response = get_model().generate_content(prompt)
     return response.text.strip()
 
 def get_final_report(transcript):
@@ -39,10 +48,120 @@ Candidate Rating:
 
 Interviewer Summary:
 """
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    response = model.generate_content(prompt)
+    response = get_model().generate_content(prompt)
     return response.text.strip()
 
+# ────────────────────────────────
+# Background Interview Worker (one per browser session)
+# ────────────────────────────────
+
+# The live transcript fragment refreshes every second and touches its worker; a worker not
+# touched for this long belongs to a closed tab and shuts down, releasing the microphone
+WORKER_TIMEOUT = 30
+
+class InterviewWorker:
+    # Capture runs on its own thread and only queues audio, so a slow transcription or Gemini
+    # call never stops the mic. Nothing here touches st.*; the page reads the worker's state.
+    def __init__(self):
+        self.last_seen = time.monotonic()
+        # Each session calibrates its own energy threshold, so the recognizer is never shared
+        self.recognizer = sr.Recognizer()
+        self.listening = False
+        self.status = "🎤 Mic is Off"
+        self.transcript_history = ""
+        self.followup_responses = []
+        self.report = None
+        self.report_pending = False
+        self._calibrated = False
+        self._stop = threading.Event()
+        self._audio = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._capture, daemon=True).start()
+        threading.Thread(target=self._process, daemon=True).start()
+
+    def stop(self):
+        self.listening = False
+        self._stop.set()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def _running(self):
+        if not self._stop.is_set() and time.monotonic() - self.last_seen > WORKER_TIMEOUT:
+            self.stop()
+        return not self._stop.is_set()
+
+    def clear(self):
+        with self._lock:
+            self.transcript_history = ""
+            self.followup_responses = []
+
+    def request_report(self):
+        if self.report_pending:
+            return
+        self.report_pending = True
+        threading.Thread(target=self._build_report, daemon=True).start()
+
+    def _capture(self):
+        while self._running():
+            if not self.listening:
+                time.sleep(0.1)
+                continue
+            try:
+                with sr.Microphone() as source:
+                    # Ambient noise is measured once per session, not before every utterance
+                    if not self._calibrated:
+                        self.status = "🎧 Calibrating microphone..."
+                        self.recognizer.adjust_for_ambient_noise(source)
+                        self._calibrated = True
+                    self.status = "🎙️ Mic On – Speak now!"
+                    while self.listening and self._running():
+                        try:
+                            self._audio.put(self.recognizer.listen(source, timeout=1, phrase_time_limit=15))
+                        except sr.WaitTimeoutError:
+                            continue
+            except Exception as e:
+                self.status = f"[Mic Error: {e}]"
+                self.listening = False
+                continue
+            self.status = "🎤 Mic is Off"
+
+    def _process(self):
+        while self._running():
+            try:
+                audio = self._audio.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                new_text = self.recognizer.recognize_google(audio)
+            except sr.UnknownValueError:
+                new_text = "[Unrecognized Speech]"
+            except sr.RequestError as e:
+                new_text = f"[API Error: {e}]"
+            except Exception as e:
+                new_text = f"[Error: {str(e)}]"
+
+            # Generate AI follow-up questions for this candidate's response
+            try:
+                followups = get_follow_up_questions(new_text)
+            except Exception as e:
+                followups = f"[Gemini Error: {e}]"
+
+            # Append candidate answer + AI suggestions inside transcript
+            with self._lock:
+                self.transcript_history += (
+                    f"Candidate: {new_text}\n"
+                    f"AI Suggestions:\n{followups}\n\n"
+                )
+                self.followup_responses.append((new_text, followups))
+
+    def _build_report(self):
+        try:
+            self.report = get_final_report(self.transcript_history)
+        except Exception as e:
+            self.report = f"[Gemini Error: {e}]"
+        self.report_pending = False
+
 # ────────────────────────────────
 # Streamlit App Setup
 # ────────────────────────────────
@@ -51,9 +170,10 @@ st.set_page_config(page_title="HireScope AI", layout="centered")
 st.title("🤖 HireScope AI — Interview Assistant")
 
 # Initialize session state
-for key in ['transcript_history', 'listening', 'interview_started', 'followup_responses']:
-    if key not in st.session_state:
-        st.session_state[key] = "" if key == 'transcript_history' else False if key != 'followup_responses' else []
+if 'interview_started' not in st.session_state:
+    st.session_state.interview_started = False
+if 'worker' not in st.session_state:
+    st.session_state.worker = None
 
 # ────────────────────────────────
 # Start/Stop Interview
@@ -61,38 +181,20 @@ for key in ['transcript_history', 'listening', 'interview_started', 'followup_re
 
 if st.button("🚀 Start / Stop Interview"):
     st.session_state.interview_started = not st.session_state.interview_started
-    st.session_state.listening = False  # Reset mic on interview toggle
-    if not st.session_state.interview_started:
+    if st.session_state.worker:
         # Clear everything on stop, optional
-        st.session_state.transcript_history = ""
-        st.session_state.followup_responses = []
+        st.session_state.worker.stop()
+        st.session_state.worker = None
+    if st.session_state.interview_started:
+        st.session_state.worker = InterviewWorker()
+
+worker = st.session_state.worker
 
 if st.session_state.interview_started:
     st.success("🟢 Interview Active – You may now use mic and export tools.")
 else:
     st.warning("🔒 Please start the interview to enable controls.")
 
-# ────────────────────────────────
-# Speech Recognition Functions
-# ────────────────────────────────
-
-recognizer = sr.Recognizer()
-
-def listen_and_transcribe():
-    with sr.Microphone() as source:
-        recognizer.adjust_for_ambient_noise(source)
-        st.toast("🎧 Listening... Speak now")
-        try:
-            audio = recognizer.listen(source)
-            text = recognizer.recognize_google(audio)
-            return text
-        except sr.UnknownValueError:
-            return "[Unrecognized Speech]"
-        except sr.RequestError as e:
-            return f"[API Error: {e}]"
-        except Exception as e:
-            return f"[Error: {str(e)}]"
-
 # ────────────────────────────────
 # Mic Toggle Button
 # ────────────────────────────────
@@ -100,69 +202,49 @@ def listen_and_transcribe():
 mic_disabled = not st.session_state.interview_started
 mic_btn = st.button("🎙️ Click to Mute/Unmute Mic", disabled=mic_disabled)
 
-if mic_btn:
-    st.session_state.listening = not st.session_state.listening
+if mic_btn and worker:
+    worker.listening = not worker.listening
 
 # ────────────────────────────────
-# Live Listening & AI Feedback (appended in transcript)
+# Live Transcript (refreshed on its own without rerunning the page)
 # ────────────────────────────────
 
-if st.session_state.listening and st.session_state.interview_started:
-    st.success("🎙️ Mic On – Speak now!")
-    placeholder = st.empty()
-    while st.session_state.listening:
-        new_text = listen_and_transcribe()
+@st.fragment(run_every=1)
+def live_transcript():
+    if worker:
+        worker.touch()
+        st.info(worker.status)
+    st.subheader("🧾 Transcript Console")
+    history = worker.transcript_history if worker else ""
+    st.text_area("Full Transcript", value=history, height=300, disabled=True)
 
-        # Generate AI follow-up questions for this candidate's response
-        with st.spinner("🤖 Generating follow-up questions..."):
-            followups = get_follow_up_questions(new_text)
+    col1, col2 = st.columns(2)
 
-        # Append candidate answer + AI suggestions inside transcript
-        st.session_state.transcript_history += (
-            f"Candidate: {new_text}\n"
-            f"AI Suggestions:\n{followups}\n\n"
+    with col1:
+        st.button(
+            "🧹 Clear Transcript",
+            on_click=worker.clear if worker else None,
+            disabled=not st.session_state.interview_started
         )
-        st.session_state.followup_responses.append((new_text, followups))
-        placeholder.success("📝 Transcribed & AI Suggestions added")
-
-        time.sleep(0.5)
 
-elif not mic_disabled:
-    st.info("🎤 Mic is Off")
+    with col2:
+        st.download_button(
+            "💾 Download Transcript",
+            history,
+            file_name="transcript.txt",
+            disabled=not st.session_state.interview_started
+        )
 
-# ────────────────────────────────
-# Transcript Display
-# ────────────────────────────────
+    st.markdown("---")
+    st.subheader("📄 Interview Summary Report")
 
-st.subheader("🧾 Transcript Console")
-st.text_area("Full Transcript", value=st.session_state.transcript_history, height=300, disabled=True)
+    if st.button("📤 Export Report", disabled=not st.session_state.interview_started):
+        worker.request_report()
 
-# ────────────────────────────────
-# Bottom Action Buttons
-# ────────────────────────────────
+    if worker and worker.report_pending:
+        st.info("🧠 Generating report...")
+    elif worker and worker.report:
+        st.text_area("📋 HireScope AI Report", worker.report, height=400)
+        st.download_button("⬇️ Download Report", worker.report, file_name="hirescope_interview_report.txt")
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.button(
-        "🧹 Clear Transcript",
-        on_click=lambda: (st.session_state.update(transcript_history="", followup_responses=[])),
-        disabled=not st.session_state.interview_started
-    )
-
-with col2:
-    st.download_button(
-        "💾 Download Transcript",
-        st.session_state.transcript_history,
-        file_name="transcript.txt",
-        disabled=not st.session_state.interview_started
-    )
-
-st.markdown("---")
-st.subheader("📄 Interview Summary Report")
-
-if st.button("📤 Export Report", disabled=not st.session_state.interview_started):
-    with st.spinner("🧠 Generating report..."):
-        report = get_final_report(st.session_state.transcript_history)
-        st.text_area("📋 HireScope AI Report", report, height=400)
-        st.download_button("⬇️ Download Report", report, file_name="hirescope_interview_report.txt")
+live_transcript()
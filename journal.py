@@ -0,0 +1,89 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# Append-only JSON Lines journal of an interview. Events are written by a background thread
+# that batches them and fsyncs once per batch, so a crash loses at most flush_interval seconds.
+JOURNAL_DIR = os.getenv("HIRESCOPE_JOURNAL_DIR", os.path.join(os.path.expanduser("~"), ".hirescope", "sessions"))
+
+def new_journal_path(directory=JOURNAL_DIR):
+    # Creates the file exclusively, so two interviews started in the same second never share one
+    os.makedirs(directory, exist_ok=True)
+    stem = time.strftime("interview-%Y%m%d-%H%M%S")
+    for attempt in itertools.count(1):
+        path = os.path.join(directory, f"{stem}.jsonl" if attempt == 1 else f"{stem}-{attempt}.jsonl")
+        try:
+            open(path, "x").close()
+            return path
+        except FileExistsError:
+            continue
+
+def read_events(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write; everything before it is intact
+                return
+
+def _drop_torn_tail(path):
+    # Cut anything after the last newline so resumed writes start on a clean line
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+class SessionJournal:
+    def __init__(self, path, flush_interval=0.5, batch_size=64):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._events = queue.Queue()
+        _drop_torn_tail(path)
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._write_events, daemon=True)
+        self._thread.start()
+
+    def append(self, event):
+        self._events.put(event)
+
+    def sync(self):
+        # Blocks until every event appended so far is on disk. A closed journal has already
+        # flushed everything, so there is nothing to wait for.
+        done = threading.Event()
+        self._events.put(done)
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                return
+
+    def close(self):
+        self._events.put(None)
+        self._thread.join()
+
+    def _write_events(self):
+        while True:
+            batch = [self._events.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self._events.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            for event in batch:
+                if isinstance(event, dict):
+                    self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for event in batch:
+                if isinstance(event, threading.Event):
+                    event.set()
+            if batch[-1] is None:
+                self._file.close()
+                return
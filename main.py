@@ -1,9 +1,24 @@
-from ui import InterviewAssistant
-from ai_service import check_ollama_running
+import argparse
+import sys
 
 if __name__ == "__main__":
-    if not check_ollama_running():
-        print("Ollama not running. Please start it before launching the app.")
-    else:
-        app = InterviewAssistant()
-        app.mainloop()
+    if sys.argv[1:2] == ["batch"]:
+        # Headless mode: no Tk window, no microphone
+        from batch import main as run_batch
+        run_batch(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ["serve"]:
+        # Multi-room HTTP/WebSocket service, also headless
+        from service import main as run_service
+        run_service(sys.argv[2:])
+        sys.exit()
+
+    from ui import InterviewAssistant
+
+    parser = argparse.ArgumentParser(description="HireScope AI - Interview Assistant (see 'main.py batch -h' and 'main.py serve -h')")
+    parser.add_argument("--resume", metavar="JOURNAL", help="continue an interview from its session journal")
+    args = parser.parse_args()
+
+    # The window opens straight away; Ollama and the microphone are checked in the background
+    app = InterviewAssistant(resume_path=args.resume)
+    app.mainloop()
@@ -0,0 +1,122 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Per-question latency spans for each pipeline stage, shared by the audio, AI and UI code.
+STAGES = (
+    "calibration",
+    "listen",
+    "recognition",
+    "queue_wait",
+    "llm_first_token",
+    "llm_generation",
+    "ui_dispatch",
+)
+
+STAGE_LABELS = {
+    "calibration": "Calibrate",
+    "listen": "Listen",
+    "recognition": "ASR",
+    "queue_wait": "Queue",
+    "llm_first_token": "First token",
+    "llm_generation": "LLM",
+    "ui_dispatch": "UI",
+}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = math.floor(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+class LatencyTracker:
+    # max_spans keeps only the most recent spans, for processes that run indefinitely
+    def __init__(self, max_spans=None):
+        self.question = 0
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.question = 0
+            self._spans.clear()
+
+    def next_question(self):
+        with self._lock:
+            self.question += 1
+            return self.question
+
+    def record(self, stage, seconds, question=None):
+        with self._lock:
+            self._spans.append({
+                "question": self.question if question is None else question,
+                "stage": stage,
+                "seconds": seconds,
+                "at": time.time(),
+            })
+
+    @contextmanager
+    def span(self, stage, question=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, question)
+
+    def question_totals(self, question=None):
+        question = self.question if question is None else question
+        totals = defaultdict(float)
+        with self._lock:
+            for span in self._spans:
+                if span["question"] == question:
+                    totals[span["stage"]] += span["seconds"]
+        return dict(totals)
+
+    def summary_line(self, question=None):
+        totals = self.question_totals(question)
+        return " · ".join(
+            f"{STAGE_LABELS[stage]} {totals[stage]:.1f}s" for stage in STAGES if stage in totals
+        )
+
+    def summary(self):
+        by_stage = defaultdict(list)
+        with self._lock:
+            for span in self._spans:
+                by_stage[span["stage"]].append(span["seconds"])
+        return {
+            stage: {
+                "count": len(values),
+                "total_seconds": round(sum(values), 4),
+                "p50_seconds": round(percentile(values, 50), 4),
+                "p95_seconds": round(percentile(values, 95), 4),
+            }
+            for stage, values in by_stage.items()
+        }
+
+    def to_json(self):
+        with self._lock:
+            spans = list(self._spans)
+        return json.dumps({"questions": self.question, "stages": self.summary(), "spans": spans}, indent=2)
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP hirescope_stage_seconds Latency of each interview pipeline stage",
+            "# TYPE hirescope_stage_seconds summary",
+        ]
+        for stage, stats in sorted(self.summary().items()):
+            lines.append(f'hirescope_stage_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50_seconds"]}')
+            lines.append(f'hirescope_stage_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95_seconds"]}')
+            lines.append(f'hirescope_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+            lines.append(f'hirescope_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Prometheus text format for .prom files, JSON otherwise
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+tracker = LatencyTracker()
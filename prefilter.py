@@ -0,0 +1,70 @@
+import re
+import threading
+
+# Cheap local check run before an utterance is sent to the LLM. Interviewer questions and
+# short filler ("okay", "um, yes") would only produce an empty or useless generation.
+
+FILLER_WORDS = {
+    "ah", "alright", "and", "er", "hmm", "i", "like", "mhm", "mm", "no", "oh", "ok", "okay",
+    "right", "so", "sure", "thank", "thanks", "uh", "um", "well", "yeah", "yep", "yes", "you",
+}
+
+# Candidates start answers with these too ("When I was at ...", "What I did was ..."), so they
+# only mark a question when the utterance also addresses the listener or ends in "?"
+WH_OPENERS = ("what", "why", "how", "when", "where", "who", "which")
+
+SECOND_PERSON = {"you", "your", "yours", "you're", "you've", "you'd", "yourself"}
+
+QUESTION_OPENERS = (
+    "can you", "could you", "would you", "will you", "do you", "did you", "have you",
+    "are you", "were you", "is there", "tell me", "walk me", "describe", "explain",
+    "give me", "talk me", "let's talk about",
+)
+
+class UtteranceFilter:
+    def __init__(self, min_content_words=3, max_question_words=30):
+        self.min_content_words = min_content_words
+        self.max_question_words = max_question_words
+        self.checked = 0
+        self.questions = 0
+        self.fillers = 0
+        self._lock = threading.Lock()
+
+    def classify(self, text):
+        # Returns "answer", "question" or "filler"
+        words = re.findall(r"[a-z']+", text.lower())
+        content = [word for word in words if word not in FILLER_WORDS]
+        if len(content) < self.min_content_words:
+            return "filler"
+        opening = " ".join(words[:4])
+        addressed = not SECOND_PERSON.isdisjoint(words)
+        asks = (
+            text.rstrip().endswith("?")
+            or opening.startswith(QUESTION_OPENERS)
+            or (bool(words) and words[0] in WH_OPENERS and addressed)
+        )
+        if asks and len(words) <= self.max_question_words:
+            return "question"
+        return "answer"
+
+    def check(self, text):
+        kind = self.classify(text)
+        with self._lock:
+            self.checked += 1
+            if kind == "question":
+                self.questions += 1
+            elif kind == "filler":
+                self.fillers += 1
+        return kind
+
+    @property
+    def llm_calls_saved(self):
+        return self.questions + self.fillers
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "questions": self.questions,
+            "fillers": self.fillers,
+            "llm_calls_saved": self.llm_calls_saved,
+        }
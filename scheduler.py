@@ -0,0 +1,75 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+
+# Persistent pool of LLM workers. Jobs run in priority order; submitting a job with the same
+# coalescing key as a still-pending one drops the older job, so a backlog never produces
+# follow-ups for answers that have already been superseded.
+FOLLOW_UP = 0
+REPORT = 1
+SUMMARY = 2
+
+# Match this to the Ollama server's OLLAMA_NUM_PARALLEL; more workers than slots just queue there
+LLM_CONCURRENCY = int(os.getenv("HIRESCOPE_LLM_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+
+class Job:
+    def __init__(self, fn, priority, key=None):
+        self.fn = fn
+        self.priority = priority
+        self.key = key
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+        self.started = None
+
+    def cancel(self):
+        # Pending jobs are dropped; running jobs are expected to check .cancelled and stop early
+        self.cancelled = True
+
+class LLMScheduler:
+    def __init__(self, workers=LLM_CONCURRENCY):
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._active = set()
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, fn, priority=FOLLOW_UP, key=None):
+        # fn is called with the Job so long-running work can poll job.cancelled
+        job = Job(fn, priority, key)
+        with self._lock:
+            if key is not None:
+                superseded = self._by_key.get(key)
+                if superseded is not None:
+                    superseded.cancel()
+                self._by_key[key] = job
+            self._active.add(job)
+        self._queue.put((priority, next(self._order), job))
+        return job
+
+    def cancel(self, priority=None):
+        # Cancels pending and running jobs, optionally only those of one priority
+        with self._lock:
+            for job in self._active:
+                if priority is None or job.priority == priority:
+                    job.cancel()
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                if job.key is not None and self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+            try:
+                if not job.cancelled:
+                    job.started = time.perf_counter()
+                    job.fn(job)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._active.discard(job)
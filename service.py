@@ -0,0 +1,543 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import struct
+import sys
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import ai_service
+from metrics import LatencyTracker
+from prefilter import UtteranceFilter
+from scheduler import FOLLOW_UP, REPORT, SUMMARY, LLM_CONCURRENCY, Job
+from session import InterviewSession
+
+# Multi-room interview service:
+#
+#   python main.py serve --port 8765
+#
+# Every room (session) shares one admission queue in front of the model. Rooms are served
+# round-robin within each priority, requests are dispatched in batches sized to the free LLM
+# slots so concurrent rooms land in Ollama's parallel slots together, and once the queue is
+# full new requests are refused (HTTP 503 / a "busy" WebSocket message) instead of piling up.
+#
+#   POST   /sessions/<id>/answers   {"text": ...}  -> {"kind": ..., "follow_up": ...}
+#   POST   /sessions/<id>/report                   -> {"report": ...}
+#   DELETE /sessions/<id>
+#   GET    /sessions/<id>/ws        WebSocket: send {"type": "answer", "text": ...} or
+#                                   {"type": "report"}; receive start/token/end/report/busy
+#   GET    /health, /metrics
+
+MAX_PENDING = 64
+MAX_PENDING_PER_SESSION = 8
+# Once a request is waiting, how long the dispatcher lets a batch fill before sending it
+BATCH_LINGER = 0.02
+MAX_BODY_BYTES = 1 << 20
+# Latency spans kept for /metrics and Retry-After estimates; older ones are dropped
+METRICS_WINDOW = 2000
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class Saturated(Exception):
+    # Raised by admit() when the queue, or one session's share of it, is full
+    def __init__(self, retry_after):
+        super().__init__(f"LLM backend saturated, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class LLMRequest(Job):
+    def __init__(self, session_id, fn, priority, key=None):
+        super().__init__(fn, priority, key)
+        self.session_id = session_id
+        self.future = asyncio.get_running_loop().create_future()
+
+    def cancel(self):
+        # Call on the event loop; the worker thread only ever reads .cancelled
+        super().cancel()
+        if not self.future.done():
+            self.future.set_result(None)
+
+class AdmissionQueue:
+    # Pending LLM requests from every session. The lowest priority value goes first, and
+    # within a priority sessions take turns, so one busy room can't starve the others.
+    def __init__(self, capacity=MAX_PENDING, per_session=MAX_PENDING_PER_SESSION):
+        self.capacity = capacity
+        self.per_session = per_session
+        self._sessions = OrderedDict()
+        self._pending = 0
+        self._ready = asyncio.Event()
+        self.admitted = 0
+        self.rejected = 0
+        self.superseded = 0
+
+    def __len__(self):
+        return self._pending
+
+    def has_room(self, session_id, key=None):
+        # Whether admit() would accept a request; a request that supersedes one always fits
+        queue = self._sessions.get(session_id)
+        if key is not None and queue and any(pending.key == key for pending in queue):
+            return True
+        return self._pending < self.capacity and not (queue and len(queue) >= self.per_session)
+
+    def admit(self, request, retry_after=1):
+        queue = self._sessions.get(request.session_id)
+        if request.key is not None and queue:
+            for i, pending in enumerate(queue):
+                if pending.key == request.key:
+                    # Same coalescing rule as LLMScheduler: the newer request replaces the older
+                    pending.cancel()
+                    queue[i] = request
+                    self.superseded += 1
+                    self.admitted += 1
+                    return
+        if not self.has_room(request.session_id):
+            self.rejected += 1
+            raise Saturated(retry_after)
+        self._sessions.setdefault(request.session_id, deque()).append(request)
+        self._pending += 1
+        self.admitted += 1
+        self._ready.set()
+
+    def drop_session(self, session_id):
+        for request in self._sessions.pop(session_id, ()):
+            request.cancel()
+            self._pending -= 1
+
+    def _pop(self):
+        priority = min(request.priority for queue in self._sessions.values() for request in queue)
+        for session_id, queue in self._sessions.items():
+            request = next((request for request in queue if request.priority == priority), None)
+            if request is None:
+                continue
+            queue.remove(request)
+            self._pending -= 1
+            if queue:
+                self._sessions.move_to_end(session_id)
+            else:
+                del self._sessions[session_id]
+            return request
+
+    async def take(self, limit, linger=BATCH_LINGER):
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        if self._pending < limit:
+            await asyncio.sleep(linger)
+        batch = []
+        while self._pending and len(batch) < limit:
+            batch.append(self._pop())
+        return batch
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "sessions_waiting": len(self._sessions),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "superseded": self.superseded,
+        }
+
+class InterviewRoom:
+    def __init__(self, service, session_id):
+        self.service = service
+        self.id = session_id
+        self.session = InterviewSession()
+        self.utterance_filter = UtteranceFilter()
+        # Per-answer digests keyed by segment index; the report is a reduce over them
+        self.digests = {}
+        # One outgoing message queue per connected WebSocket
+        self.subscribers = set()
+
+    def broadcast(self, message):
+        for outgoing in self.subscribers:
+            outgoing.put_nowait(message)
+
+    def _post(self, message):
+        # From a worker thread
+        self.service.loop.call_soon_threadsafe(self.broadcast, message)
+
+    async def answer(self, text):
+        kind = self.utterance_filter.check(text)
+        self.broadcast({"type": "classified", "kind": kind, "text": text})
+        if kind == "filler":
+            return kind, None
+        if kind == "answer":
+            # Refuse before recording anything, so a retried answer isn't stored twice. Nothing
+            # awaits between this check and the submit below, so the submit can't be refused.
+            self.service.check_admission(self.id, key="follow_up")
+        # Question-like utterances skip the follow-up but stay in the candidate's record
+        now = time.time()
+        segment = self.session.add_segment("candidate", text, now, now)
+        follow_up = None
+        if kind == "answer":
+            follow_up = self.service.submit(self.id, partial(self._follow_up, segment), FOLLOW_UP, key="follow_up")
+        try:
+            self.service.submit(self.id, partial(self._digest, segment), SUMMARY)
+        except Saturated:
+            # The report summarizes any answer that is still missing a digest
+            pass
+        return kind, (await follow_up if follow_up else None)
+
+    async def report(self):
+        report = await self.service.submit(self.id, self._report, REPORT)
+        self.broadcast({"type": "report", "text": report})
+        return report
+
+    def _follow_up(self, segment, request):
+        tracker = self.service.tracker
+        self._post({"type": "start", "index": segment.index})
+        tokens = []
+        stream = None
+        try:
+            stream = ai_service.get_interview_questions(segment.text, stream=True)
+            for token in stream:
+                if request.cancelled:
+                    break
+                if not tokens:
+                    tracker.record("llm_first_token", time.perf_counter() - request.started)
+                tokens.append(token)
+                self._post({"type": "token", "index": segment.index, "text": token})
+        finally:
+            if stream is not None:
+                stream.close()
+        response = "".join(tokens)
+        tracker.record("llm_generation", time.perf_counter() - request.started)
+        if not request.cancelled:
+            self.session.set_ai_response(segment.index, response)
+        self._post({"type": "end", "index": segment.index, "text": response})
+        return response
+
+    def _digest(self, segment, request):
+        digest = ai_service.summarize_answer(segment.text)
+        if not digest.startswith("Error calling Ollama API"):
+            self.digests[segment.index] = digest
+        return digest
+
+    def _report(self, request):
+        for segment in self.session.candidate_segments():
+            if segment.index not in self.digests:
+                self._digest(segment, request)
+        digests = [self.digests[index] for index in sorted(self.digests)]
+        if not digests:
+            return "No candidate answers to report on yet."
+        return ai_service.get_report_from_digests(digests)
+
+class InterviewService:
+    def __init__(self, batch_size=LLM_CONCURRENCY, capacity=MAX_PENDING, per_session=MAX_PENDING_PER_SESSION,
+                 linger=BATCH_LINGER):
+        self.batch_size = max(1, batch_size)
+        self.capacity = capacity
+        self.per_session = per_session
+        self.linger = linger
+        self.rooms = {}
+        self.tracker = LatencyTracker(max_spans=METRICS_WINDOW)
+        self.in_flight = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.batch_size)
+        self._tasks = set()
+        self.loop = None
+        self.queue = None
+        self._slot_freed = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.loop = asyncio.get_running_loop()
+        self.queue = AdmissionQueue(self.capacity, self.per_session)
+        self._slot_freed = asyncio.Event()
+        self._spawn(self._dispatch())
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        # Stops accepting connections and cancels the dispatcher and anything in flight
+        self.server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def room(self, session_id):
+        if session_id not in self.rooms:
+            self.rooms[session_id] = InterviewRoom(self, session_id)
+        return self.rooms[session_id]
+
+    def close_room(self, session_id):
+        room = self.rooms.pop(session_id, None)
+        self.queue.drop_session(session_id)
+        return room is not None
+
+    def retry_after(self):
+        # Seconds until the queue has likely drained by one batch
+        generation = self.tracker.summary().get("llm_generation")
+        per_request = generation["p50_seconds"] if generation else 1
+        return max(1, math.ceil(per_request * (len(self.queue) + 1) / self.batch_size))
+
+    def check_admission(self, session_id, key=None):
+        if not self.queue.has_room(session_id, key):
+            self.queue.rejected += 1
+            raise Saturated(self.retry_after())
+
+    def submit(self, session_id, fn, priority, key=None):
+        # fn runs on an LLM thread and is called with its request; raises Saturated when full
+        request = LLMRequest(session_id, fn, priority, key)
+        self.queue.admit(request, self.retry_after())
+        return request.future
+
+    async def _dispatch(self):
+        while True:
+            free = self.batch_size - self.in_flight
+            if free <= 0:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+                continue
+            batch = await self.queue.take(free, self.linger)
+            self.batches += 1
+            self.batched_requests += len(batch)
+            for request in batch:
+                self.in_flight += 1
+                self._spawn(self._run(request))
+
+    async def _run(self, request):
+        try:
+            if request.cancelled:
+                return
+            request.started = time.perf_counter()
+            self.tracker.record("queue_wait", request.started - request.submitted)
+            result = await self.loop.run_in_executor(self._executor, request.fn, request)
+            if not request.future.done():
+                request.future.set_result(result)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self._slot_freed.set()
+
+    def stats(self):
+        return {
+            "sessions": len(self.rooms),
+            "in_flight": self.in_flight,
+            "batch_size": self.batch_size,
+            "saturated": len(self.queue) >= self.capacity,
+            "batches": self.batches,
+            "mean_batch": round(self.batched_requests / self.batches, 2) if self.batches else 0,
+            "queue": self.queue.stats(),
+        }
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            method, path, headers, body = await _read_request(reader)
+            parts = path.split("?")[0].strip("/").split("/")
+            if method == "GET" and parts == ["health"]:
+                await _respond(writer, 200, self.stats())
+            elif method == "GET" and parts == ["metrics"]:
+                await _respond(writer, 200, self.tracker.to_prometheus(), "text/plain; version=0.0.4")
+            elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "ws" and method == "GET":
+                if headers.get("upgrade", "").lower() != "websocket":
+                    await _respond(writer, 400, {"error": "expected a WebSocket upgrade"})
+                else:
+                    await self._websocket(self.room(parts[1]), WebSocket(reader, writer, headers))
+            elif len(parts) == 3 and parts[0] == "sessions" and method == "POST":
+                await self._post(writer, self.room(parts[1]), parts[2], body)
+            elif len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+                closed = self.close_room(parts[1])
+                await _respond(writer, 200 if closed else 404, {"closed": closed})
+            else:
+                await _respond(writer, 404, {"error": "not found"})
+        except (ValueError, json.JSONDecodeError) as e:
+            await _respond(writer, 400, {"error": str(e)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            traceback.print_exc()
+            try:
+                await _respond(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _post(self, writer, room, action, body):
+        try:
+            if action == "answers":
+                text = _answer_text(json.loads(body or b"{}"))
+                if text is None:
+                    raise ValueError("expected a JSON object with a non-empty 'text' string")
+                kind, follow_up = await room.answer(text)
+                await _respond(writer, 200, {"kind": kind, "follow_up": follow_up})
+            elif action == "report":
+                await _respond(writer, 200, {"report": await room.report()})
+            else:
+                await _respond(writer, 404, {"error": "not found"})
+        except Saturated as e:
+            await _respond(writer, 503, {"error": str(e)}, headers={"Retry-After": str(e.retry_after)})
+
+    async def _websocket(self, room, ws):
+        await ws.accept()
+        outgoing = asyncio.Queue()
+        room.subscribers.add(outgoing)
+        sender = self._spawn(self._send_messages(ws, outgoing))
+        try:
+            while True:
+                message = await ws.recv()
+                if message is None:
+                    break
+                try:
+                    request = json.loads(message)
+                except json.JSONDecodeError:
+                    request = None
+                if not isinstance(request, dict):
+                    outgoing.put_nowait({"type": "error", "error": "messages must be JSON objects"})
+                    continue
+                if request.get("type") == "answer" and _answer_text(request):
+                    self._spawn(self._ws_request(outgoing, room.answer(_answer_text(request))))
+                elif request.get("type") == "report":
+                    self._spawn(self._ws_request(outgoing, room.report()))
+                else:
+                    outgoing.put_nowait({"type": "error", "error": "expected an answer or report request"})
+        finally:
+            room.subscribers.discard(outgoing)
+            sender.cancel()
+
+    async def _ws_request(self, outgoing, request):
+        # Results reach the client through the room's broadcasts; only refusals come back here
+        try:
+            await request
+        except Saturated as e:
+            outgoing.put_nowait({"type": "busy", "retry_after": e.retry_after})
+        except Exception as e:
+            outgoing.put_nowait({"type": "error", "error": str(e)})
+
+    async def _send_messages(self, ws, outgoing):
+        try:
+            while True:
+                await ws.send(json.dumps(await outgoing.get()))
+        except ConnectionError:
+            pass
+
+def _answer_text(request):
+    # The stripped "text" of a decoded answer request, or None if it has none
+    if not isinstance(request, dict) or not isinstance(request.get("text"), str):
+        return None
+    return request["text"].strip() or None
+
+async def _read_request(reader):
+    request_line = (await reader.readuntil(b"\r\n")).decode("latin-1").rstrip()
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readuntil(b"\r\n")).decode("latin-1").rstrip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+async def _respond(writer, status, body, content_type="application/json", headers=None):
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+    data = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {reasons.get(status, '')}", f"Content-Type: {content_type}",
+             f"Content-Length: {len(data)}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+
+class WebSocket:
+    # Just enough of RFC 6455 for JSON text messages: no extensions, no binary frames
+    def __init__(self, reader, writer, headers):
+        self.reader = reader
+        self.writer = writer
+        self.key = headers.get("sec-websocket-key", "")
+
+    async def accept(self):
+        digest = hashlib.sha1((self.key + WEBSOCKET_GUID).encode("ascii")).digest()
+        self.writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {base64.b64encode(digest).decode('ascii')}\r\n\r\n"
+        ).encode("ascii"))
+        await self.writer.drain()
+
+    async def _frame(self, opcode, payload=b""):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+        self.writer.write(header + payload)
+        await self.writer.drain()
+
+    async def send(self, text):
+        await self._frame(0x1, text.encode("utf-8"))
+
+    async def recv(self):
+        # Returns the next text message, or None once the client closes
+        message = b""
+        while True:
+            first, second = await self.reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+            if length > MAX_BODY_BYTES:
+                raise ValueError("WebSocket message too large")
+            mask = await self.reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await self.reader.readexactly(length)))
+            if opcode == 0x8:
+                await self._frame(0x8, payload[:2])
+                return None
+            if opcode == 0x9:
+                await self._frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1):
+                message += payload
+                if first & 0x80:
+                    return message.decode("utf-8")
+
+async def serve(host, port, service):
+    server = await service.start(host, port)
+    print(f"HireScope service listening on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Host many interview rooms against one model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-size", type=int, default=LLM_CONCURRENCY, help="LLM requests in flight")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING, help="queued requests before refusing more")
+    parser.add_argument("--max-pending-per-session", type=int, default=MAX_PENDING_PER_SESSION)
+    parser.add_argument("--ollama-url", default=ai_service.OLLAMA_URL, help="e.g. a fake_ollama.py server for testing")
+    args = parser.parse_args(argv)
+
+    ai_service.client = ai_service.OllamaClient(base_url=args.ollama_url, max_in_flight=args.batch_size)
+    service = InterviewService(args.batch_size, args.max_pending, args.max_pending_per_session)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
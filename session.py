@@ -0,0 +1,107 @@
+import csv
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+from journal import SessionJournal, read_events
+
+# Structured model of an interview: one segment per transcribed utterance with the AI
+# response it produced. Exports and report prompts are built from this, never from the
+# transcript widget, so banners and earlier AI suggestions don't leak into them.
+# When given a journal, every change is also appended to it as it happens.
+
+@dataclass
+class Segment:
+    index: int
+    speaker: str
+    start: float
+    end: float
+    text: str
+    ai_response: str = ""
+
+class InterviewSession:
+    def __init__(self, journal=None, started=None):
+        self.started = started or time.time()
+        self.segments = []
+        self.journal = journal
+        self._lock = threading.Lock()
+        if journal and started is None:
+            journal.append({"type": "session", "started": self.started})
+
+    @classmethod
+    def from_journal(cls, path, resume=False):
+        # Rebuilds a session from its journal; with resume=True new events keep appending to it
+        session = cls()
+        for event in read_events(path):
+            if event["type"] == "session":
+                session.started = event["started"]
+            elif event["type"] == "segment":
+                session.segments.append(Segment(**event["segment"]))
+            elif event["type"] == "ai_response":
+                session.segments[event["index"]].ai_response = event["text"]
+        if resume:
+            session.journal = SessionJournal(path)
+        return session
+
+    def add_segment(self, speaker, text, start, end):
+        with self._lock:
+            segment = Segment(len(self.segments), speaker, start, end, text)
+            self.segments.append(segment)
+            if self.journal:
+                self.journal.append({"type": "segment", "segment": asdict(segment)})
+            return segment
+
+    def set_ai_response(self, index, text):
+        with self._lock:
+            self.segments[index].ai_response = text
+            if self.journal:
+                self.journal.append({"type": "ai_response", "index": index, "text": text})
+
+    def close(self):
+        with self._lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+
+    def candidate_segments(self):
+        with self._lock:
+            return [segment for segment in self.segments if segment.speaker == "candidate"]
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self.segments)
+
+    def _offset(self, timestamp):
+        seconds = max(0, int(timestamp - self.started))
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+    def write_txt(self, f):
+        for segment in self._snapshot():
+            f.write(f"[{self._offset(segment.start)}] {segment.speaker.title()}: {segment.text}\n")
+            if segment.ai_response:
+                f.write(f"Interviewer AI:\n{segment.ai_response.strip()}\n")
+            f.write("\n")
+
+    def write_jsonl(self, f):
+        for segment in self._snapshot():
+            f.write(json.dumps(asdict(segment)) + "\n")
+
+    def write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(["index", "speaker", "start", "end", "text", "ai_response"])
+        for segment in self._snapshot():
+            writer.writerow([segment.index, segment.speaker, segment.start, segment.end, segment.text, segment.ai_response])
+
+    @classmethod
+    def export_journal(cls, journal_path, path):
+        cls.from_journal(journal_path).export(path)
+
+    def export(self, path):
+        # Format follows the file extension; anything unrecognised is written as plain text
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if path.endswith(".jsonl"):
+                self.write_jsonl(f)
+            elif path.endswith(".csv"):
+                self.write_csv(f)
+            else:
+                self.write_txt(f)
@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import ai_service
+import service
+from fake_ollama import FakeOllamaServer
+from scheduler import FOLLOW_UP, SUMMARY
+
+ANSWER = "I rebuilt the billing pipeline in Go and cut our nightly batch from six hours to forty minutes"
+
+class AdmissionQueueTest(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_sessions_take_turns_within_a_priority(self):
+        async def scenario():
+            queue = service.AdmissionQueue(capacity=10, per_session=5)
+            for session_id in ["a", "a", "a", "b", "c"]:
+                queue.admit(service.LLMRequest(session_id, None, SUMMARY))
+            queue.admit(service.LLMRequest("c", None, FOLLOW_UP))
+            return [(request.session_id, request.priority) for request in await queue.take(6, linger=0)]
+
+        order = self.run_async(scenario())
+        self.assertEqual(order[0], ("c", FOLLOW_UP))
+        self.assertEqual([session_id for session_id, _ in order[1:]], ["a", "b", "c", "a", "a"])
+
+    def test_newer_keyed_request_supersedes_pending_one(self):
+        async def scenario():
+            queue = service.AdmissionQueue(capacity=1, per_session=1)
+            first = service.LLMRequest("a", None, FOLLOW_UP, key="follow_up")
+            second = service.LLMRequest("a", None, FOLLOW_UP, key="follow_up")
+            queue.admit(first)
+            queue.admit(second)
+            batch = await queue.take(5, linger=0)
+            return first, second, batch, queue
+
+        first, second, batch, queue = self.run_async(scenario())
+        self.assertTrue(first.cancelled)
+        self.assertIsNone(first.future.result())
+        self.assertEqual(batch, [second])
+        self.assertEqual(queue.superseded, 1)
+
+    def test_full_queue_refuses_with_retry_after(self):
+        async def scenario():
+            queue = service.AdmissionQueue(capacity=1, per_session=1)
+            queue.admit(service.LLMRequest("a", None, SUMMARY))
+            with self.assertRaises(service.Saturated) as refused:
+                queue.admit(service.LLMRequest("b", None, SUMMARY), retry_after=3)
+            return refused.exception, queue
+
+        refused, queue = self.run_async(scenario())
+        self.assertEqual(refused.retry_after, 3)
+        self.assertFalse(queue.has_room("b"))
+        self.assertEqual(queue.rejected, 1)
+
+class InterviewServiceTest(unittest.TestCase):
+    # Drives the HTTP/WebSocket service end to end against the stub model server
+    @classmethod
+    def setUpClass(cls):
+        cls.fake = FakeOllamaServer(first_token_latency=0.02, token_latency=0.002, tokens=5).start()
+        cls.saved = ai_service.client, ai_service.cache
+        ai_service.client = ai_service.OllamaClient(base_url=cls.fake.url, max_in_flight=2)
+        ai_service.cache = None
+        cls.loop = asyncio.new_event_loop()
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(5)
+        cls.loop.close()
+        ai_service.client, ai_service.cache = cls.saved
+        cls.fake.stop()
+
+    def start_service(self, **kwargs):
+        svc = service.InterviewService(**kwargs)
+        server = asyncio.run_coroutine_threadsafe(svc.start("127.0.0.1", 0), self.loop).result(5)
+        self.addCleanup(lambda: asyncio.run_coroutine_threadsafe(svc.stop(), self.loop).result(5))
+        return svc, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    def test_answer_gets_a_follow_up_and_report(self):
+        svc, url = self.start_service(batch_size=2)
+        response = requests.post(f"{url}/sessions/room1/answers", json={"text": ANSWER}, timeout=10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"kind": "answer", "follow_up": "".join(self.fake.response_tokens())})
+        report = requests.post(f"{url}/sessions/room1/report", timeout=10)
+        self.assertEqual(report.status_code, 200)
+        self.assertTrue(report.json()["report"])
+        self.assertEqual(len(svc.rooms["room1"].session.segments), 1)
+
+    def test_saturated_service_refuses_without_recording_the_answer(self):
+        svc, url = self.start_service(batch_size=1, capacity=0)
+        response = requests.post(f"{url}/sessions/room1/answers", json={"text": ANSWER}, timeout=10)
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(svc.rooms["room1"].session.segments, [])
+
+    def test_malformed_bodies_are_bad_requests(self):
+        _, url = self.start_service()
+        for body in [b"[]", b'"text"', b'{"text": 5}', b"{bad"]:
+            response = requests.post(f"{url}/sessions/room1/answers", data=body, timeout=10)
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_websocket_streams_the_follow_up(self):
+        _, url = self.start_service(batch_size=2)
+        host, port = url[len("http://"):].split(":")
+        with socket.create_connection((host, int(port)), timeout=10) as sock:
+            key = base64.b64encode(os.urandom(16)).decode("ascii")
+            sock.sendall((
+                "GET /sessions/room1/ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+            ).encode("ascii"))
+            reader = sock.makefile("rb")
+            self.assertIn(b"101", reader.readline())
+            while reader.readline() not in (b"\r\n", b""):
+                pass
+            send_text(sock, json.dumps({"type": "answer", "text": ANSWER}))
+            messages = []
+            while not messages or messages[-1]["type"] != "end":
+                messages.append(json.loads(read_text(reader)))
+        types = [message["type"] for message in messages]
+        self.assertEqual(types[:2], ["classified", "start"])
+        self.assertEqual(types.count("token"), self.fake.tokens)
+        self.assertEqual(messages[-1]["text"], "".join(self.fake.response_tokens()))
+
+def send_text(sock, text):
+    # Clients must mask their frames
+    payload, mask = text.encode("utf-8"), os.urandom(4)
+    length = bytes([0x80 | len(payload)]) if len(payload) < 126 else bytes([0x80 | 126]) + len(payload).to_bytes(2, "big")
+    sock.sendall(b"\x81" + length + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+def read_text(reader):
+    header = reader.read(2)
+    length = header[1] & 0x7F
+    if length == 126:
+        length = int.from_bytes(reader.read(2), "big")
+    return reader.read(length).decode("utf-8")
+
+
+if __name__ == "__main__":
+    unittest.main()
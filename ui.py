@@ -2,8 +2,14 @@ import tkinter as tk
 from tkinter import scrolledtext, filedialog
 import threading
 import queue
-from audio_handler import AudioStreamHandler
-from ai_service import get_interview_questions, getReportForInterview
+import os
+import time
+from metrics import tracker
+from session import InterviewSession
+from journal import SessionJournal, new_journal_path
+from prefilter import UtteranceFilter
+from scheduler import LLMScheduler, FOLLOW_UP, REPORT, SUMMARY
+from ai_service import FollowUpDrafter, summarize_answer, get_report_from_digests, check_ollama_running, warm_up_model
 
 class AccentButton(tk.Button):
     def __init__(self, parent, **kwargs):
@@ -34,8 +40,30 @@ class AccentButton(tk.Button):
         self.config(bg=self.default_bg, fg=self.default_fg)
 
 
-class InterviewAssistant(tk.Tk):
+class TranscriptBuffer:
+    # Full transcript kept outside Tk as (text, tag) chunks; the widget only shows a window of them
+    max_chunk_chars = 4000
+
     def __init__(self):
+        self.chunks = []
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def append(self, text, tag):
+        # Consecutive text with the same tag (e.g. streamed tokens) is folded into one chunk
+        if self.chunks and self.chunks[-1][1] == tag and len(self.chunks[-1][0]) < self.max_chunk_chars:
+            self.chunks[-1] = (self.chunks[-1][0] + text, tag)
+        else:
+            self.chunks.append((text, tag))
+
+
+class InterviewAssistant(tk.Tk):
+    # Chunks rendered in the transcript widget at once, and how many to page in on scroll
+    visible_chunks = 200
+    page_chunks = 50
+
+    def __init__(self, resume_path=None):
         super().__init__()
 
         self.title("HireScope AI - Interview Assistant")
@@ -63,13 +91,71 @@ class InterviewAssistant(tk.Tk):
         self._setup_status()
         self._setup_transcript_area()
 
-        self.audio_handler = AudioStreamHandler()
-        self.processing_queue = queue.Queue()
+        # The microphone and the model come up in the background once the window is showing
+        self.audio_handler = None
+        self._readiness = {"Microphone": "starting", "Model": "checking"}
+        self.drafter = FollowUpDrafter()
+        self._partial_phrases = []
         self.ai_response_queue = queue.Queue()
 
         self.current_transcript = ""
+        self.session = InterviewSession()
+        self.utterance_filter = UtteranceFilter()
+
+        # Worker threads wake the Tk loop with a virtual event; bursts collapse into one render
+        self._update_pending = False
+        self._update_lock = threading.Lock()
+        self.bind("<<AIResponse>>", lambda event: self.check_ai_response_queue())
+
+        # Rolling per-answer digests, built in the background so the report is a small reduce step
+        self._digests = {}
+        self._digests_expected = 0
+        self._interview_id = 0
+        # Follow-ups, the report and digests share one prioritised pool of LLM workers
+        self.scheduler = LLMScheduler()
+
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after_idle(self._start_background_setup)
+        if resume_path:
+            self.start_interview(InterviewSession.from_journal(resume_path, resume=True))
+
+    def _start_background_setup(self):
+        self._show_readiness()
+        threading.Thread(target=self._open_microphone, daemon=True).start()
+        threading.Thread(target=self._warm_up_model, daemon=True).start()
+
+    def _open_microphone(self):
+        # numpy, speech_recognition and the ASR backend are only imported here, off the Tk thread
+        try:
+            from audio_handler import AudioStreamHandler
+            handler = AudioStreamHandler()
+        except Exception as e:
+            self._post("ready", ("Microphone", "unavailable", f"\n[Microphone unavailable: {e}]\n"))
+            return
+        handler.on_phrase = self._on_phrase
+        self.audio_handler = handler
+        self._post("ready", ("Microphone", "ready", None))
 
-        self.check_ai_response_queue()
+    def _warm_up_model(self):
+        if not check_ollama_running():
+            self._post("ready", ("Model", "Ollama not running", "\n[Ollama not running. Start it; follow-ups will fail until then]\n"))
+            return
+        self._post("ready", ("Model", "loading", None))
+        started = time.perf_counter()
+        try:
+            warm_up_model()
+        except Exception as e:
+            self._post("ready", ("Model", "failed to load", f"\n[Could not load the model: {e}]\n"))
+            return
+        self._post("ready", ("Model", f"ready ({time.perf_counter() - started:.1f}s)", None))
+
+    def _show_readiness(self):
+        # Readiness shares the status bar with the interview state until the interview starts
+        if self.interview_active:
+            return
+        state = self.status_var.get().split(" | ")[0]
+        parts = " | ".join(f"{name}: {status}" for name, status in self._readiness.items())
+        self.status_var.set(f"{state} | {parts}")
 
     def _setup_header(self):
         header_frame = tk.Frame(self, bg=self.bg_color)
@@ -161,8 +247,7 @@ class InterviewAssistant(tk.Tk):
             relief=tk.FLAT,
             borderwidth=0,
             insertbackground=self.accent_color,
-            undo=True,
-            maxundo=-1,
+            undo=False,
             spacing3=5,
             height=28,
         )
@@ -175,7 +260,14 @@ class InterviewAssistant(tk.Tk):
 
         self.text_area.configure(state=tk.DISABLED)
 
-    def start_interview(self):
+        self.transcript = TranscriptBuffer()
+        # The widget holds chunks [_view_start, _view_end) of the transcript buffer
+        self._view_start = 0
+        self._view_end = 0
+        self._paging_scheduled = False
+        self.text_area.configure(yscrollcommand=self._on_transcript_scroll)
+
+    def start_interview(self, session=None):
         self.interview_active = True
         self.status_var.set("Status: Interview Active")
         self.btn_start_interview.config(state=tk.DISABLED)
@@ -186,7 +278,34 @@ class InterviewAssistant(tk.Tk):
         self.btn_export_transcript.config(state=tk.DISABLED)
         self.btn_export_report.config(state=tk.DISABLED)
 
-        self._append_text("\n=== Interview Started ===\n", "system")
+        self._interview_id += 1
+        self._digests = {}
+        self._digests_expected = 0
+        self.utterance_filter = UtteranceFilter()
+        self.scheduler.cancel()
+        self.session.close()
+        tracker.reset()
+
+        if session is None:
+            # Every segment and AI response is journaled as it arrives so a crash loses nothing
+            self.session = InterviewSession(SessionJournal(new_journal_path()))
+            self._append_text("\n=== Interview Started ===\n", "system")
+            return
+
+        self.session = session
+        self._append_text(f"\n=== Interview Resumed from {session.journal.path} ===\n", "system")
+        for segment in session.segments:
+            self._append_text(f"\n{segment.speaker.title()}: {segment.text}\n", "user")
+            if segment.speaker == "candidate" and self.utterance_filter.classify(segment.text) != "filler":
+                self._queue_digest(segment)
+            if segment.ai_response:
+                self._append_text(f"\nInterviewer AI:\n{segment.ai_response}\n", "ai")
+
+    def _on_close(self):
+        if self.audio_handler:
+            self.audio_handler.stop_listening()
+        self.session.close()
+        self.destroy()
 
     def end_interview(self):
         self.interview_active = False
@@ -200,9 +319,11 @@ class InterviewAssistant(tk.Tk):
         self.btn_export_report.config(state=tk.NORMAL)
 
         self._append_text("\n=== Interview Ended ===\n", "system")
-        self.audio_handler.stop_listening()
-        with self.processing_queue.mutex:
-            self.processing_queue.queue.clear()
+        if self.audio_handler:
+            self.audio_handler.stop_listening()
+        self.drafter.cancel()
+        # Digests are kept so the report can still be exported
+        self.scheduler.cancel(FOLLOW_UP)
         with self.ai_response_queue.mutex:
             self.ai_response_queue.queue.clear()
 
@@ -210,77 +331,294 @@ class InterviewAssistant(tk.Tk):
         if not self.interview_active:
             self._append_text("\n[Start Interview before starting questions]\n", "system")
             return
+        if self.audio_handler is None:
+            self._append_text(f"\n[Microphone not ready: {self._readiness['Microphone']}]\n", "system")
+            return
         self._append_text("\n[Listening... Speak Now]\n", "system")
         self.btn_start_question.config(state=tk.DISABLED)
         self.btn_end_question.config(state=tk.NORMAL)
         self.current_transcript = ""
+        self._partial_phrases = []
+        tracker.next_question()
         self.audio_handler.start_listening()
 
+    def _on_phrase(self, phrase):
+        # Runs on a recognition worker: start drafting follow-ups before the answer is over
+        if not phrase.text:
+            return
+        self._partial_phrases.append(phrase.text)
+        partial = " ".join(self._partial_phrases)
+        if self.utterance_filter.classify(partial) == "answer":
+            self.drafter.update(partial)
+
     def stop_recording(self):
         self.audio_handler.stop_listening()
-        self.btn_start_question.config(state=tk.NORMAL)
         self.btn_end_question.config(state=tk.DISABLED)
+        self.status_var.set("Status: Transcribing Answer")
+        # Recognition of the last phrases may still be in flight; wait for it off the Tk thread
+        threading.Thread(target=self._collect_answer, daemon=True).start()
 
+    def _collect_answer(self):
+        self.audio_handler.wait_until_idle(timeout=30)
         collected = []
         while not self.audio_handler.audio_queue.empty():
             phrase = self.audio_handler.audio_queue.get()
-            if phrase:
+            if phrase.text:
                 collected.append(phrase)
-
-        self.current_transcript = " ".join(collected).strip()
+        text = " ".join(phrase.text for phrase in collected).strip()
+        if collected:
+            self._post("answer", (text, collected[0].started, collected[-1].ended))
+        else:
+            self._post("answer", (text, None, None))
+
+    def _handle_answer(self, answer):
+        transcript, start, end = answer
+        if self.interview_active:
+            self.status_var.set("Status: Interview Active")
+            self.btn_start_question.config(state=tk.NORMAL)
+        self.current_transcript = transcript
 
         if not self.current_transcript:
             self._append_text("\n[No clear audio detected. Skipping AI processing]\n", "system")
             return
 
+        # The classification only decides whether a follow-up is worth an LLM call. The segment
+        # stays the candidate's, and anything but filler still gets a digest for the report.
+        kind = self.utterance_filter.check(self.current_transcript)
+        segment = self.session.add_segment("candidate", self.current_transcript, start, end)
         self._append_text(f"\nCandidate: {self.current_transcript}\n", "user")
-        self.processing_queue.put(self.current_transcript)
-
-        if not hasattr(self, 'ai_thread') or not self.ai_thread.is_alive():
-            self.ai_thread = threading.Thread(target=self.process_ai_responses, daemon=True)
-            self.ai_thread.start()
+        if kind != "answer":
+            self.drafter.cancel()
+            saved = self.utterance_filter.llm_calls_saved
+            self._append_text(f"\n[Skipped AI suggestions for {kind}; {saved} LLM calls saved so far]\n", "system")
+            if kind == "question":
+                self._queue_digest(segment)
+            return
 
-    def process_ai_responses(self):
-        while not self.processing_queue.empty():
-            transcript = self.processing_queue.get()
-            ai_response = get_interview_questions(transcript)
-            self.ai_response_queue.put(ai_response)
+        session, question = self.session, tracker.question
+        # Only the newest pending follow-up is worth generating; older ones are coalesced away
+        self.scheduler.submit(
+            lambda job: self._generate_follow_up(job, session, segment.index, transcript, question),
+            FOLLOW_UP, key="follow_up",
+        )
+        self._queue_digest(segment)
+
+    def _generate_follow_up(self, job, session, index, transcript, question):
+        started = job.started
+        tracker.record("queue_wait", started - job.submitted, question)
+        first_token = None
+        tokens = []
+        if job.cancelled:
+            return
+        stream = self.drafter.finalize(transcript)
+        for token in stream:
+            if job.cancelled:
+                stream.close()
+                break
+            if first_token is None:
+                first_token = time.perf_counter()
+                tracker.record("llm_first_token", first_token - started, question)
+                self._post("start", (question, first_token))
+            tokens.append(token)
+            self._post("token", token)
+        if job.cancelled:
+            # A truncated suggestion must not be journaled or exported as the answer's response
+            return
+        if first_token is None:
+            self._post("start", (question, time.perf_counter()))
+        tracker.record("llm_generation", time.perf_counter() - started, question)
+        session.set_ai_response(index, "".join(tokens))
+        self._post("end", question)
+
+    def _queue_digest(self, segment):
+        self._digests_expected += 1
+        interview_id = self._interview_id
+        self.scheduler.submit(lambda job: self._summarize(interview_id, segment.index, segment.text), SUMMARY)
+
+    def _summarize(self, interview_id, index, transcript):
+        try:
+            digest = summarize_answer(transcript)
+        except Exception as e:
+            # Still record it, or the report would wait for this digest forever
+            digest = f"Error calling Ollama API: {e}"
+        if interview_id == self._interview_id:
+            self._digests[index] = digest
+
+    def _post(self, kind, payload=None):
+        self.ai_response_queue.put((kind, payload))
+        with self._update_lock:
+            if self._update_pending:
+                return
+            self._update_pending = True
+        try:
+            # event_generate is marshalled onto the Tk thread, so it is safe to call from workers
+            self.event_generate("<<AIResponse>>", when="tail")
+        except (tk.TclError, RuntimeError):
+            # The window is gone (or not running yet). Clear the flag so a later post can
+            # still wake the loop; the queued item is picked up by that render.
+            with self._update_lock:
+                self._update_pending = False
 
     def check_ai_response_queue(self):
-        try:
-            while True:
-                response = self.ai_response_queue.get_nowait()
-                self._append_text(f"\nInterviewer AI:\n{response}\n", "ai")
-        except queue.Empty:
-            pass
-        self.after(500, self.check_ai_response_queue)
+        with self._update_lock:
+            self._update_pending = False
+        tokens = []
+        while True:
+            try:
+                kind, payload = self.ai_response_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "token":
+                tokens.append(payload)
+                continue
+            if tokens:
+                self._append_text("".join(tokens), "ai")
+                tokens = []
+            if kind == "answer":
+                self._handle_answer(payload)
+            elif kind == "status":
+                self.status_var.set(payload)
+            elif kind == "ready":
+                name, status, message = payload
+                self._readiness[name] = status
+                self._show_readiness()
+                if message:
+                    self._append_text(message, "system")
+            elif kind == "system":
+                self._append_text(payload, "system")
+            elif kind == "report":
+                self._save_report(payload)
+            elif kind == "start":
+                question, posted = payload
+                tracker.record("ui_dispatch", time.perf_counter() - posted, question)
+                self._append_text("\nInterviewer AI:\n", "ai")
+            elif kind == "end":
+                self._append_text("\n", "ai")
+                if self.interview_active:
+                    self.status_var.set(f"Status: Interview Active | {tracker.summary_line(payload)}")
+        if tokens:
+            self._append_text("".join(tokens), "ai")
 
     def _append_text(self, text, tag=None):
+        following = self._view_end == len(self.transcript)
+        self.transcript.append(text, tag)
+        if not following:
+            # The interviewer is reading older pages; new text stays in the buffer until they scroll down
+            return
         self.text_area.configure(state=tk.NORMAL)
         self.text_area.insert(tk.END, text, tag)
+        self._view_end = len(self.transcript)
+        while self._view_end - self._view_start > self.visible_chunks:
+            self._drop_first_visible_chunk()
         self.text_area.see(tk.END)
         self.text_area.configure(state=tk.DISABLED)
 
+    def _drop_first_visible_chunk(self):
+        length = len(self.transcript.chunks[self._view_start][0])
+        self.text_area.delete("1.0", f"1.0 + {length} chars")
+        self._view_start += 1
+        return length
+
+    def _drop_last_visible_chunk(self):
+        self._view_end -= 1
+        length = len(self.transcript.chunks[self._view_end][0])
+        self.text_area.delete(f"end - {length + 1} chars", "end - 1 chars")
+
+    def _on_transcript_scroll(self, first, last):
+        self.text_area.vbar.set(first, last)
+        at_top = float(first) <= 0.0 and self._view_start > 0
+        at_bottom = float(last) >= 1.0 and self._view_end < len(self.transcript)
+        if (at_top or at_bottom) and not self._paging_scheduled:
+            self._paging_scheduled = True
+            self.after_idle(self._page_transcript)
+
+    def _page_transcript(self):
+        self._paging_scheduled = False
+        first, last = self.text_area.yview()
+        self.text_area.configure(state=tk.NORMAL)
+        if first <= 0.0 and self._view_start > 0:
+            # Page older chunks in above the view and keep the current top line in place
+            start = max(0, self._view_start - self.page_chunks)
+            inserted = 0
+            for text, tag in reversed(self.transcript.chunks[start:self._view_start]):
+                self.text_area.insert("1.0", text, tag)
+                inserted += len(text)
+            self._view_start = start
+            while self._view_end - self._view_start > self.visible_chunks:
+                self._drop_last_visible_chunk()
+            self.text_area.yview(f"1.0 + {inserted} chars")
+        elif last >= 1.0 and self._view_end < len(self.transcript):
+            top = len(self.text_area.get("1.0", "@0,0"))
+            end = min(len(self.transcript), self._view_end + self.page_chunks)
+            for text, tag in self.transcript.chunks[self._view_end:end]:
+                self.text_area.insert("end - 1 chars", text, tag)
+            self._view_end = end
+            while self._view_end - self._view_start > self.visible_chunks:
+                top -= self._drop_first_visible_chunk()
+            self.text_area.yview(f"1.0 + {max(0, top)} chars")
+        self.text_area.configure(state=tk.DISABLED)
+
     def export_transcript(self):
-        if not self.current_transcript:
+        if not self.session.segments:
             self._append_text("\n[No transcript available to export]\n", "system")
             return
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt")],
+            filetypes=[("Text files", "*.txt"), ("JSON Lines", "*.jsonl"), ("CSV files", "*.csv")],
             title="Save Transcript As"
         )
         if file_path:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(self.text_area.get("1.0", tk.END))
-            self._append_text(f"\n[Transcript exported to {file_path}]\n", "system")
+            threading.Thread(target=self._write_transcript, args=(self.session, file_path), daemon=True).start()
+
+    def _write_transcript(self, session, file_path):
+        # Export is a conversion of the on-disk journal once everything queued has been flushed.
+        # Starting a new interview closes the session (and clears .journal) meanwhile, so hold on to it.
+        journal = session.journal
+        if journal:
+            journal.sync()
+            InterviewSession.export_journal(journal.path, file_path)
+        else:
+            session.export(file_path)
+        metrics_path = os.path.splitext(file_path)[0] + ".metrics.json"
+        tracker.write(metrics_path)
+        self._post("system", f"\n[Transcript exported to {file_path}, latency metrics to {metrics_path}]\n")
 
     def export_report(self):
-        if not self.current_transcript:
+        answers = self._digests_expected
+        if not answers:
             self._append_text("\n[No interview data available for report]\n", "system")
             return
 
-        report = getReportForInterview(self.text_area.get("1.0", tk.END))
+        self.btn_export_report.config(state=tk.DISABLED)
+        threading.Thread(target=self._build_report, args=(self._interview_id, answers), daemon=True).start()
+
+    def _build_report(self, interview_id, total):
+        while interview_id == self._interview_id and len(self._digests) < total:
+            self._post("status", f"Status: Building Report ({len(self._digests)}/{total} answers summarized)")
+            time.sleep(0.5)
+        digests = self._digests
+        if interview_id != self._interview_id:
+            # A new interview started while we waited; its digests are not this report's
+            self._post("report", None)
+            return
+        digests = [digests[i] for i in sorted(digests)]
+        summarized = [digest for digest in digests if not digest.startswith("Error calling Ollama API")]
+        if len(summarized) < len(digests):
+            self._post("system", f"\n[{len(digests) - len(summarized)} of {total} answers could not be summarized and are left out of the report]\n")
+        if not summarized:
+            self._post("report", None)
+            return
+        self.scheduler.submit(lambda job: self._reduce_report(summarized), REPORT)
+
+    def _reduce_report(self, digests):
+        self._post("status", "Status: Generating Report")
+        self._post("report", get_report_from_digests(digests))
+
+    def _save_report(self, report):
+        self.status_var.set("Status: Interview Active" if self.interview_active else "Status: Interview Ended")
+        self.btn_export_report.config(state=tk.DISABLED if self.interview_active else tk.NORMAL)
+        if report is None:
+            return
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text files", "*.txt")],